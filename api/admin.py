@@ -1,6 +1,7 @@
 from django.contrib import admin
-from .models import Ticket, Image
+from .models import Ticket, TicketStats, Image
 
 # Register your models here.
 admin.site.register(Ticket)
 admin.site.register(Image)
+admin.site.register(TicketStats)
@@ -0,0 +1,50 @@
+from django.db import transaction
+
+from .cache import invalidate_tickets
+from .models import ArchivedImage, ArchivedTicket, Image, Ticket
+
+BATCH_SIZE = 1000
+
+
+def columns(model):
+    return [field.attname for field in model._meta.concrete_fields]
+
+
+def archive_batch(cutoff, after_id=0, batch_size=BATCH_SIZE):
+    """
+    Move the next batch of tickets completed before ``cutoff``, with their
+    images, to the archive tables in one transaction. Returns the ids moved.
+    """
+    with transaction.atomic():
+        # Walks the primary key, so each batch starts where the last ended
+        ids = list(
+            Ticket.objects.filter(
+                id__gt=after_id, status='COMPLETED', updated_at__lt=cutoff
+            )
+            .order_by('id')
+            .select_for_update(skip_locked=True)
+            .values_list('id', flat=True)[:batch_size]
+        )
+        if not ids:
+            return ids
+        ArchivedTicket.objects.bulk_create(
+            ArchivedTicket(**row)
+            for row in Ticket.objects.filter(id__in=ids).values(*columns(Ticket))
+        )
+        images = Image.objects.filter(ticket_id__in=ids)
+        ArchivedImage.objects.bulk_create(
+            (ArchivedImage(**row) for row in images.values(*columns(Image))),
+            batch_size=batch_size,
+        )
+        images.delete()
+        Ticket.objects.filter(id__in=ids).delete()
+        transaction.on_commit(lambda: invalidate_tickets(ids))
+    return ids
+
+
+def archive_tickets(cutoff, batch_size=BATCH_SIZE):
+    """Archive all tickets completed before ``cutoff``, yielding each batch's size."""
+    after_id = 0
+    while ids := archive_batch(cutoff, after_id, batch_size):
+        after_id = ids[-1]
+        yield len(ids)
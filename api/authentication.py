@@ -1,5 +1,27 @@
+from django.utils.translation import gettext_lazy as _
 from rest_framework.authentication import TokenAuthentication
+from rest_framework.exceptions import AuthenticationFailed
+
+from .cache import get_token_user, set_token_user
 
 
 class BearerTokenAuthentication(TokenAuthentication):
     keyword = 'Bearer'
+
+
+class CachedBearerTokenAuthentication(BearerTokenAuthentication):
+    """
+    Bearer token authentication that caches the token's user, so most
+    requests are authenticated without querying the database. Cached entries
+    are invalidated by the signals in ``api.signals``.
+    """
+
+    def authenticate_credentials(self, key):
+        user = get_token_user(key)
+        if user is None:
+            user, token = super().authenticate_credentials(key)
+            set_token_user(key, user)
+            return user, token
+        if not user.is_active:
+            raise AuthenticationFailed(_('User inactive or deleted.'))
+        return user, self.get_model()(key=key, user=user)
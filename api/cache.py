@@ -0,0 +1,135 @@
+import hashlib
+import threading
+import time
+import uuid
+from collections import OrderedDict
+
+from django.conf import settings
+from django.contrib.auth.models import User
+from django.core.cache import cache
+
+
+class LocalTTLCache:
+    """Small thread-safe in-process LRU cache whose entries expire after a TTL."""
+
+    def __init__(self, maxsize, ttl):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self._data = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key, default=None):
+        with self._lock:
+            item = self._data.get(key)
+            if item is None:
+                return default
+            value, expires_at = item
+            if expires_at < time.monotonic():
+                del self._data[key]
+                return default
+            self._data.move_to_end(key)
+            return value
+
+    def set(self, key, value):
+        with self._lock:
+            self._data[key] = (value, time.monotonic() + self.ttl)
+            self._data.move_to_end(key)
+            while len(self._data) > self.maxsize:
+                self._data.popitem(last=False)
+
+    def delete(self, key):
+        with self._lock:
+            self._data.pop(key, None)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+
+
+# Users authenticated by token. The local cache answers most requests without
+# a network round trip; its short TTL bounds how long other processes can
+# keep using a token after it has been invalidated in the shared cache.
+local_token_cache = LocalTTLCache(
+    maxsize=settings.TOKEN_AUTH_LOCAL_CACHE_SIZE,
+    ttl=settings.TOKEN_AUTH_LOCAL_CACHE_TIMEOUT,
+)
+
+
+def _token_cache_key(key):
+    # Never store raw tokens in the shared cache
+    return 'auth:token:' + hashlib.sha256(key.encode()).hexdigest()
+
+
+def get_token_user(key):
+    cached_user = local_token_cache.get(key)
+    if cached_user is None:
+        cached_user = cache.get(_token_cache_key(key))
+        if cached_user is None:
+            return None
+        local_token_cache.set(key, cached_user)
+    # Only what authentication and the views need is cached, not the
+    # password hash; the user built from it must never be saved
+    return User(pk=cached_user['pk'], is_active=cached_user['is_active'])
+
+
+def set_token_user(key, user):
+    cached_user = {'pk': user.pk, 'is_active': user.is_active}
+    cache.set(_token_cache_key(key), cached_user, settings.TOKEN_AUTH_CACHE_TIMEOUT)
+    local_token_cache.set(key, cached_user)
+
+
+def invalidate_token(key):
+    cache.delete(_token_cache_key(key))
+    local_token_cache.delete(key)
+
+
+# Serialized tickets, along with what is needed to check ownership and
+# answer conditional requests without querying the database. Invalidating a
+# ticket also gives it a new version, and entries filled under an older one
+# are ignored, so a request that read the ticket before it changed can't
+# put it back in the cache. Versions outlive the entries filled under them.
+
+
+def _ticket_cache_key(ticket_id):
+    return f'ticket:{ticket_id}'
+
+
+def _ticket_version_key(ticket_id):
+    return f'ticket-version:{ticket_id}'
+
+
+def get_cached_ticket(ticket_id):
+    """Return the cached ticket, or None, and the version to fill it with."""
+    key, version_key = _ticket_cache_key(ticket_id), _ticket_version_key(ticket_id)
+    values = cache.get_many([key, version_key])
+    version = values.get(version_key)
+    cached_ticket = values.get(key)
+    if cached_ticket is not None and cached_ticket['version'] != version:
+        cached_ticket = None
+    return cached_ticket, version
+
+
+def set_cached_ticket(ticket, data, version):
+    cached_ticket = {
+        'user_id': ticket.user_id,
+        'updated_at': ticket.updated_at,
+        'data': dict(data),
+        'version': version,
+    }
+    cache.set(
+        _ticket_cache_key(ticket.pk), cached_ticket, settings.TICKET_CACHE_TIMEOUT
+    )
+    return cached_ticket
+
+
+def invalidate_ticket(ticket_id):
+    invalidate_tickets([ticket_id])
+
+
+def invalidate_tickets(ticket_ids):
+    version = uuid.uuid4().hex
+    cache.set_many(
+        {_ticket_version_key(ticket_id): version for ticket_id in ticket_ids},
+        2 * settings.TICKET_CACHE_TIMEOUT,
+    )
+    cache.delete_many([_ticket_cache_key(ticket_id) for ticket_id in ticket_ids])
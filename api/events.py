@@ -0,0 +1,161 @@
+import asyncio
+import json
+import logging
+import threading
+import weakref
+from collections import defaultdict
+from contextlib import asynccontextmanager
+from functools import lru_cache
+
+import redis
+import redis.asyncio
+from django.conf import settings
+from django.utils.module_loading import import_string
+
+logger = logging.getLogger(__name__)
+
+
+def ticket_channel(ticket_id):
+    return f'tickets:{ticket_id}'
+
+
+def user_channel(user_id):
+    return f'users:{user_id}:tickets'
+
+
+class InMemoryEventBroker:
+    """
+    Delivers events to subscribers in the same process. Suitable for a
+    single-node deployment running web and worker in one process, and tests.
+    """
+
+    def __init__(self):
+        self._subscribers = defaultdict(set)
+        self._lock = threading.Lock()
+
+    def publish(self, channel, event):
+        with self._lock:
+            subscribers = list(self._subscribers[channel])
+        for loop, queue in subscribers:
+            loop.call_soon_threadsafe(queue.put_nowait, event)
+
+    @asynccontextmanager
+    async def subscribe(self, *channels):
+        subscriber = (asyncio.get_running_loop(), asyncio.Queue())
+        with self._lock:
+            for channel in channels:
+                self._subscribers[channel].add(subscriber)
+        try:
+            yield InMemorySubscription(subscriber[1])
+        finally:
+            with self._lock:
+                for channel in channels:
+                    self._subscribers[channel].discard(subscriber)
+
+
+class InMemorySubscription:
+    def __init__(self, queue):
+        self.queue = queue
+
+    async def get(self, timeout):
+        try:
+            return await asyncio.wait_for(self.queue.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+class RedisEventBroker:
+    """
+    Delivers events across processes and hosts through Redis pub/sub. The
+    subscribers of a process share one pub/sub connection per event loop.
+    """
+
+    def __init__(self, url=None):
+        self.url = url or settings.TICKET_EVENTS_REDIS_URL
+        self.connection = redis.Redis.from_url(self.url)
+        self._listeners = weakref.WeakKeyDictionary()
+
+    def publish(self, channel, event):
+        self.connection.publish(channel, json.dumps(event))
+
+    @asynccontextmanager
+    async def subscribe(self, *channels):
+        loop = asyncio.get_running_loop()
+        listener = self._listeners.get(loop)
+        if listener is None:
+            listener = self._listeners[loop] = RedisListener(self.url)
+        queue = asyncio.Queue()
+        await listener.add(queue, channels)
+        try:
+            yield InMemorySubscription(queue)
+        finally:
+            await listener.remove(queue, channels)
+
+
+class RedisListener:
+    """
+    A pub/sub connection subscribed to the channels of all its subscribers,
+    whose messages are put on the queues of the subscribers of the channel.
+    """
+
+    def __init__(self, url):
+        self.pubsub = redis.asyncio.Redis.from_url(url).pubsub()
+        self.queues = defaultdict(set)
+        self.lock = asyncio.Lock()
+        self.task = None
+
+    async def add(self, queue, channels):
+        async with self.lock:
+            new_channels = [channel for channel in channels if not self.queues[channel]]
+            for channel in channels:
+                self.queues[channel].add(queue)
+            if new_channels:
+                await self.pubsub.subscribe(*new_channels)
+            if self.task is None or self.task.done():
+                self.task = asyncio.create_task(self.listen())
+
+    async def remove(self, queue, channels):
+        async with self.lock:
+            unused_channels = []
+            for channel in channels:
+                self.queues[channel].discard(queue)
+                if not self.queues[channel]:
+                    del self.queues[channel]
+                    unused_channels.append(channel)
+            if unused_channels:
+                await self.pubsub.unsubscribe(*unused_channels)
+
+    async def listen(self):
+        # Runs while there are subscribers; add() starts it again after
+        while self.queues:
+            try:
+                message = await self.pubsub.get_message(
+                    ignore_subscribe_messages=True, timeout=1.0
+                )
+            except redis.RedisError:
+                # Subscribers get keep-alives until the connection is back,
+                # when the channels are subscribed to again
+                logger.exception('Ticket events connection failed')
+                await asyncio.sleep(1)
+                continue
+            if message is None:
+                continue
+            event = json.loads(message['data'])
+            for queue in self.queues.get(message['channel'].decode(), ()):
+                queue.put_nowait(event)
+
+
+@lru_cache
+def _load_event_broker(path):
+    return import_string(path)()
+
+
+def get_event_broker():
+    return _load_event_broker(settings.TICKET_EVENTS_BROKER)
+
+
+def publish_ticket_event(ticket_id, user_id, status):
+    event = {'id': ticket_id, 'status': status}
+    broker = get_event_broker()
+    broker.publish(ticket_channel(ticket_id), event)
+    broker.publish(user_channel(user_id), event)
@@ -0,0 +1,64 @@
+import csv
+
+from asgiref.sync import sync_to_async
+
+from .renderers import FastJSONRenderer
+
+# Rows read from the database per round trip, and bytes collected before
+# they are sent, so large exports are neither one query nor a write per row
+EXPORT_CHUNK_SIZE = 2000
+EXPORT_BUFFER_SIZE = 64 * 1024
+
+
+def buffered(chunks, size=EXPORT_BUFFER_SIZE):
+    buffer = []
+    length = 0
+    for chunk in chunks:
+        buffer.append(chunk)
+        length += len(chunk)
+        if length >= size:
+            yield b''.join(buffer)
+            buffer = []
+            length = 0
+    if buffer:
+        yield b''.join(buffer)
+
+
+def export_ndjson(rows):
+    renderer = FastJSONRenderer()
+    return buffered(renderer.render(row) + b'\n' for row in rows)
+
+
+class Echo:
+    """File-like object whose writes return what was written, for csv.writer."""
+
+    def write(self, value):
+        return value
+
+
+def export_csv(rows, fields):
+    writer = csv.writer(Echo())
+
+    def lines():
+        yield writer.writerow(fields).encode()
+        for row in rows:
+            yield writer.writerow(row[field] for field in fields).encode()
+
+    return buffered(lines())
+
+
+async def aiter_chunks(chunks):
+    """
+    Yield the chunks of a synchronous iterator, made one at a time in a
+    thread. Under ASGI a synchronous iterator would be read to the end,
+    in memory, before the first chunk is sent.
+    """
+    chunks = iter(chunks)
+    done = object()
+    try:
+        while (chunk := await sync_to_async(next)(chunks, done)) is not done:
+            yield chunk
+    finally:
+        # Closes the database cursor when the client goes away early
+        if hasattr(chunks, 'close'):
+            await sync_to_async(chunks.close)()
@@ -0,0 +1,25 @@
+from django_filters import rest_framework as filters
+
+from .models import ArchivedTicket, Ticket
+from .search import search_tickets
+
+
+class TicketFilter(filters.FilterSet):
+    q = filters.CharFilter(method='search')
+
+    class Meta:
+        model = Ticket
+        # Every filter combined with the user is served by an index on Ticket
+        fields = {
+            'status': ['exact'],
+            'created_at': ['exact', 'gte', 'lt'],
+            'updated_at': ['gte', 'lt'],
+        }
+
+    def search(self, queryset, name, value):
+        return search_tickets(queryset, value)
+
+
+class ArchivedTicketFilter(TicketFilter):
+    class Meta(TicketFilter.Meta):
+        model = ArchivedTicket
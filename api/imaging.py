@@ -0,0 +1,87 @@
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from PIL import Image as PILImage
+from PIL import ImageOps
+
+logger = logging.getLogger(__name__)
+
+_pool = None
+_pool_lock = threading.Lock()
+
+
+def optimize_image(data, max_dimension, quality):
+    """
+    Re-encode an image so neither side exceeds ``max_dimension`` pixels,
+    dropping EXIF and other metadata. JPEGs are saved at ``quality``.
+    GIFs, which may be animated, images that would not get smaller and
+    images that can't be decoded are returned unchanged.
+    """
+    try:
+        optimized = _reencode(data, max_dimension, quality)
+    except (OSError, SyntaxError, PILImage.DecompressionBombError) as error:
+        # Truncated or corrupt files only have valid magic bytes
+        logger.warning('Image not optimized: %s', error)
+        return data
+    return optimized if len(optimized) < len(data) else data
+
+
+def _reencode(data, max_dimension, quality):
+    with PILImage.open(BytesIO(data)) as image:
+        image_format = image.format
+        if image_format not in ('JPEG', 'PNG'):
+            return data
+        # Let the JPEG decoder downscale while decoding large photos
+        image.draft('RGB', (max_dimension, max_dimension))
+        # Apply the EXIF orientation before the EXIF data is dropped
+        image = ImageOps.exif_transpose(image)
+        image.thumbnail((max_dimension, max_dimension))
+        output = BytesIO()
+        if image_format == 'JPEG':
+            if image.mode not in ('RGB', 'L'):
+                image = image.convert('RGB')
+            image.save(output, 'JPEG', quality=quality, optimize=True, progressive=True)
+        else:
+            image.save(output, 'PNG', optimize=True)
+    return output.getvalue()
+
+
+def start_process_pool():
+    """
+    Start the pool images are encoded in, from a long-lived process such as
+    ConcurrentWorker before it starts its job threads. Its processes are
+    spawned rather than forked, so they don't inherit the parent's threads.
+    """
+    global _pool
+    with _pool_lock:
+        if _pool is None:
+            _pool = ProcessPoolExecutor(
+                settings.IMAGE_OPTIMIZATION_PROCESSES,
+                mp_context=multiprocessing.get_context('spawn'),
+            )
+
+
+def shutdown_process_pool():
+    global _pool
+    with _pool_lock:
+        if _pool is not None:
+            _pool.shutdown()
+            _pool = None
+
+
+def optimize_image_in_pool(data):
+    # Encoding is CPU bound, so it runs in separate processes while the
+    # upload threads wait on the network. Without a pool, e.g. in the work
+    # horse forked for each job by rq's default worker, it runs inline.
+    args = (
+        data,
+        settings.IMAGE_OPTIMIZATION_MAX_DIMENSION,
+        settings.IMAGE_OPTIMIZATION_QUALITY,
+    )
+    if _pool is None:
+        return optimize_image(*args)
+    return _pool.submit(optimize_image, *args).result()
@@ -0,0 +1,28 @@
+from datetime import timedelta
+
+from django.conf import settings
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from api.archive import BATCH_SIZE, archive_tickets
+
+
+class Command(BaseCommand):
+    help = (
+        'Move tickets completed more than --days days ago, with their images, '
+        'to the archive tables, in batches of one transaction each.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--days', type=int, default=settings.TICKET_ARCHIVE_AFTER_DAYS
+        )
+        parser.add_argument('--batch-size', type=int, default=BATCH_SIZE)
+
+    def handle(self, *args, **options):
+        cutoff = timezone.now() - timedelta(days=options['days'])
+        total = 0
+        for count in archive_tickets(cutoff, options['batch_size']):
+            total += count
+            self.stdout.write(f'Archived {total} tickets...')
+        self.stdout.write(self.style.SUCCESS(f'Archived {total} tickets.'))
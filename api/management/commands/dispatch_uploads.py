@@ -0,0 +1,29 @@
+import time
+
+from django.core.management.base import BaseCommand
+
+from api.scheduling import get_upload_scheduler
+
+
+class Command(BaseCommand):
+    help = (
+        'Release waiting upload jobs to the queue. Jobs are released as others '
+        'finish; run this periodically to also recover the slots of jobs whose '
+        'worker died, and enqueue released jobs that never reached the queue.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--interval',
+            type=float,
+            help='Keep dispatching every INTERVAL seconds instead of once.',
+        )
+
+    def handle(self, *args, **options):
+        scheduler = get_upload_scheduler()
+        while True:
+            scheduler.recover()
+            scheduler.dispatch()
+            if not options['interval']:
+                break
+            time.sleep(options['interval'])
@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand
+
+from api.stats import rebuild_ticket_stats
+
+
+class Command(BaseCommand):
+    help = 'Recount the per-user ticket stats from the tickets and archive tables.'
+
+    def handle(self, *args, **options):
+        count = rebuild_ticket_stats()
+        self.stdout.write(
+            self.style.SUCCESS(f'Rebuilt ticket stats for {count} users.')
+        )
@@ -0,0 +1,172 @@
+import os
+import time
+from contextlib import contextmanager
+
+import django_rq
+from django.conf import settings
+from prometheus_client import (
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+from prometheus_client.core import GaugeMetricFamily
+from redis.exceptions import RedisError
+from rq.worker import Worker, WorkerStatus
+
+DURATION_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+REQUESTS = Counter(
+    'api_requests', 'Requests by view and status code.', ['view', 'method', 'status']
+)
+REQUEST_DURATION = Histogram(
+    'api_request_duration_seconds',
+    'Wall time of requests, from the first middleware on.',
+    ['view', 'method'],
+    buckets=DURATION_BUCKETS,
+)
+REQUEST_DB_QUERIES = Histogram(
+    'api_request_db_queries',
+    'Database queries made by requests.',
+    ['view', 'method'],
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 89),
+)
+REQUEST_DB_DURATION = Histogram(
+    'api_request_db_duration_seconds',
+    'Time requests spent in database queries.',
+    ['view', 'method'],
+    buckets=DURATION_BUCKETS,
+)
+RESPONSE_SIZE = Histogram(
+    'api_response_size_bytes',
+    'Size of response bodies. Streaming responses are not included.',
+    ['view', 'method'],
+    buckets=(256, 1024, 4096, 16384, 65536, 262144, 1048576, 4194304),
+)
+
+THROTTLE_ERRORS = Counter(
+    'api_throttle_errors',
+    'Throttle checks that failed, letting the request through.',
+)
+
+UPLOAD_JOBS = Counter(
+    'upload_jobs',
+    'Upload jobs run, by outcome; retried counts runs after the first.',
+    ['outcome'],
+)
+UPLOAD_JOB_STAGE_DURATION = Histogram(
+    'upload_job_stage_seconds',
+    'Time upload jobs spent in each stage. Scheduler wait is measured from '
+    'submission to enqueueing, queue wait from enqueueing to the start of '
+    'the job, preprocess and upload per image.',
+    ['stage'],
+    buckets=(0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60, 300),
+)
+
+
+@contextmanager
+def time_stage(stage):
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(stage, time.perf_counter() - started)
+
+
+def observe_stage(stage, duration):
+    UPLOAD_JOB_STAGE_DURATION.labels(stage).observe(duration)
+
+
+def record_job_started(job):
+    observe_stage('queue_wait', (job.started_at - job.enqueued_at).total_seconds())
+    # Runs are counted in the job itself, as RQ reuses the job for retries
+    job.meta['runs'] = job.meta.get('runs', 0) + 1
+    job.save_meta()
+    if job.meta['runs'] > 1:
+        UPLOAD_JOBS.labels('retried').inc()
+
+
+class QueueCollector:
+    """
+    Reports the depth of the RQ queues and the utilization of their workers,
+    read from Redis when the metrics are collected.
+    """
+
+    def describe(self):
+        # Keeps the registry from collecting, and reaching Redis, on register
+        return []
+
+    def collect(self):
+        metrics = {
+            'jobs': GaugeMetricFamily(
+                'rq_queue_jobs', 'Jobs waiting in the queue.', labels=['queue']
+            ),
+            'started': GaugeMetricFamily(
+                'rq_queue_started_jobs', 'Jobs being run.', labels=['queue']
+            ),
+            'failed': GaugeMetricFamily(
+                'rq_queue_failed_jobs', 'Jobs in the failed registry.', labels=['queue']
+            ),
+            'workers': GaugeMetricFamily(
+                'rq_workers', 'Workers listening on the queue.', labels=['queue']
+            ),
+            'slots': GaugeMetricFamily(
+                'rq_worker_slots',
+                'Jobs the workers of the queue can run at once.',
+                labels=['queue'],
+            ),
+            'busy': GaugeMetricFamily(
+                'rq_worker_busy_slots',
+                'Jobs the workers of the queue are running.',
+                labels=['queue'],
+            ),
+        }
+        for name in settings.RQ_QUEUES:
+            try:
+                self.collect_queue(django_rq.get_queue(name), metrics)
+            except RedisError:
+                # Metrics of the web process are still served
+                continue
+        return metrics.values()
+
+    def collect_queue(self, queue, metrics):
+        workers = Worker.all(queue=queue)
+        # ConcurrentWorker stores its slots; other workers run one job at a time
+        with queue.connection.pipeline() as pipeline:
+            for worker in workers:
+                pipeline.hmget(worker.key, 'concurrency', 'running_jobs')
+            slots = pipeline.execute()
+        busy = 0
+        total = 0
+        for worker, (concurrency, running_jobs) in zip(workers, slots):
+            if concurrency is None:
+                total += 1
+                busy += worker.get_state() == WorkerStatus.BUSY
+            else:
+                total += int(concurrency)
+                busy += int(running_jobs or 0)
+        labels = [queue.name]
+        metrics['jobs'].add_metric(labels, queue.count)
+        metrics['started'].add_metric(labels, queue.started_job_registry.count)
+        metrics['failed'].add_metric(labels, queue.failed_job_registry.count)
+        metrics['workers'].add_metric(labels, len(workers))
+        metrics['slots'].add_metric(labels, total)
+        metrics['busy'].add_metric(labels, busy)
+
+
+queue_collector = QueueCollector()
+REGISTRY.register(queue_collector)
+
+
+def render_metrics():
+    # With several server processes each keeps its own values; they are
+    # aggregated from PROMETHEUS_MULTIPROC_DIR when it is set
+    if 'PROMETHEUS_MULTIPROC_DIR' in os.environ:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+        registry.register(queue_collector)
+    else:
+        registry = REGISTRY
+    return generate_latest(registry)
@@ -0,0 +1,125 @@
+import logging
+import time
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction, sync_to_async
+from django.conf import settings
+from django.db import connection
+
+from .metrics import (
+    REQUEST_DB_DURATION,
+    REQUEST_DB_QUERIES,
+    REQUEST_DURATION,
+    REQUESTS,
+    RESPONSE_SIZE,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_LOGGED_QUERIES = 100
+
+
+class QueryRecorder:
+    """Database execute wrapper counting and timing the queries it runs."""
+
+    def __init__(self, keep_sql=False):
+        self.count = 0
+        self.duration = 0.0
+        self.statements = [] if keep_sql else None
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            duration = time.perf_counter() - started
+            self.count += 1
+            self.duration += duration
+            if self.statements is not None:
+                self.statements.append((duration, sql))
+
+
+def get_execute_wrappers():
+    return connection.execute_wrappers
+
+
+class RequestMetricsMiddleware:
+    """
+    Records the wall time, database queries and response size of every
+    request in the histograms of ``api.metrics``, labelled by view name.
+
+    Requests slower than ``REQUEST_METRICS_SLOW_THRESHOLD`` seconds are
+    logged with the SQL they ran; the statements are only kept when the
+    threshold is set. Keep it first in MIDDLEWARE to time the whole stack.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(self.get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        queries = self.query_recorder()
+        started = time.perf_counter()
+        with connection.execute_wrapper(queries):
+            response = self.get_response(request)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    async def __acall__(self, request):
+        queries = self.query_recorder()
+        started = time.perf_counter()
+        # Sync code of an ASGI request, views included, runs in the thread
+        # sync_to_async hands it to, each with its own connection
+        execute_wrappers = await sync_to_async(get_execute_wrappers)()
+        execute_wrappers.append(queries)
+        try:
+            response = await self.get_response(request)
+        finally:
+            execute_wrappers.remove(queries)
+        self.record(request, response, time.perf_counter() - started, queries)
+        return response
+
+    def query_recorder(self):
+        return QueryRecorder(
+            keep_sql=settings.REQUEST_METRICS_SLOW_THRESHOLD is not None
+        )
+
+    def record(self, request, response, duration, queries):
+        match = request.resolver_match
+        view = match.view_name if match else 'unmatched'
+        labels = (view, request.method)
+        REQUESTS.labels(*labels, response.status_code).inc()
+        REQUEST_DURATION.labels(*labels).observe(duration)
+        REQUEST_DB_QUERIES.labels(*labels).observe(queries.count)
+        REQUEST_DB_DURATION.labels(*labels).observe(queries.duration)
+        if not response.streaming:
+            # Set by CommonMiddleware, which runs inside this one
+            size = response.get('Content-Length')
+            RESPONSE_SIZE.labels(*labels).observe(
+                int(size) if size else len(response.content)
+            )
+
+        slow_threshold = settings.REQUEST_METRICS_SLOW_THRESHOLD
+        if slow_threshold is not None and duration >= slow_threshold:
+            self.log_slow_request(request, view, duration, queries)
+
+    def log_slow_request(self, request, view, duration, queries):
+        statements = '\n'.join(
+            f'  {statement_duration * 1000:.1f} ms: {sql}'
+            for statement_duration, sql in queries.statements[:MAX_LOGGED_QUERIES]
+        )
+        logger.warning(
+            'Slow request %s %s (%s) took %.3fs, %d queries in %.3fs\n%s',
+            request.method,
+            request.path,
+            view,
+            duration,
+            queries.count,
+            queries.duration,
+            statements,
+        )
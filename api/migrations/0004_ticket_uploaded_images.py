@@ -0,0 +1,18 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:47
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0003_alter_image_ticket'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='ticket',
+            name='uploaded_images',
+            field=models.PositiveIntegerField(default=0),
+        ),
+    ]
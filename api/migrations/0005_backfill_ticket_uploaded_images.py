@@ -0,0 +1,36 @@
+from django.db import migrations
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+BATCH_SIZE = 10000
+
+
+def backfill_uploaded_images(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    Image = apps.get_model('api', 'Image')
+    image_count = (
+        Image.objects.filter(ticket=OuterRef('pk'))
+        .order_by()
+        .values('ticket')
+        .annotate(count=Count('id'))
+        .values('count')
+    )
+    last_id = Ticket.objects.aggregate(last_id=Max('id'))['last_id'] or 0
+    # Update in id ranges to keep each statement short on large tables
+    for start in range(0, last_id + 1, BATCH_SIZE):
+        Ticket.objects.filter(id__gte=start, id__lt=start + BATCH_SIZE).update(
+            uploaded_images=Coalesce(Subquery(image_count), 0)
+        )
+
+
+class Migration(migrations.Migration):
+    # Each id range is committed on its own rather than in one transaction
+    atomic = False
+
+    dependencies = [
+        ('api', '0004_ticket_uploaded_images'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_uploaded_images, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,51 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:49
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+from api.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without blocking writes to the table
+    atomic = False
+
+    dependencies = [
+        ("api", "0005_backfill_ticket_uploaded_images"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="ticket",
+            index=models.Index(fields=["user", "-id"], name="ticket_user_id_idx"),
+        ),
+        AddIndexConcurrently(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "status", "-id"], name="ticket_user_status_id_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "created_at"], name="ticket_user_created_idx"
+            ),
+        ),
+        AddIndexConcurrently(
+            model_name="ticket",
+            index=models.Index(
+                fields=["user", "updated_at"], name="ticket_user_updated_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="ticket",
+            name="user",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                to=settings.AUTH_USER_MODEL,
+            ),
+        ),
+    ]
@@ -0,0 +1,23 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:58
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0006_ticket_list_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="original_size",
+            field=models.PositiveIntegerField(null=True),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="uploaded_size",
+            field=models.PositiveIntegerField(null=True),
+        ),
+    ]
@@ -0,0 +1,39 @@
+# Generated by Django 5.0.4 on 2026-10-18 05:59
+
+from django.db import migrations, models
+
+from api.operations import AddIndexConcurrently, AddUniqueConstraintConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without blocking writes to the table
+    atomic = False
+
+    dependencies = [
+        ("api", "0007_image_sizes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="image",
+            name="content_hash",
+            field=models.CharField(blank=True, max_length=64),
+        ),
+        migrations.AddField(
+            model_name="image",
+            name="staged_key",
+            field=models.CharField(blank=True, max_length=100),
+        ),
+        AddIndexConcurrently(
+            model_name="image",
+            index=models.Index(fields=["content_hash"], name="image_content_hash_idx"),
+        ),
+        AddUniqueConstraintConcurrently(
+            model_name="image",
+            constraint=models.UniqueConstraint(
+                condition=models.Q(("staged_key", ""), _negated=True),
+                fields=("ticket", "staged_key"),
+                name="image_unique_ticket_staged_key",
+            ),
+        ),
+    ]
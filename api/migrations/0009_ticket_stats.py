@@ -0,0 +1,35 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:04
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0008_image_content_hash"),
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TicketStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="ticket_stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("created_tickets", models.PositiveIntegerField(default=0)),
+                ("completed_tickets", models.PositiveIntegerField(default=0)),
+                ("requested_images", models.PositiveIntegerField(default=0)),
+                ("uploaded_images", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+    ]
@@ -0,0 +1,33 @@
+from django.db import migrations
+from django.db.models import Count, Q, Sum
+
+BATCH_SIZE = 1000
+
+
+def backfill_ticket_stats(apps, schema_editor):
+    Ticket = apps.get_model('api', 'Ticket')
+    TicketStats = apps.get_model('api', 'TicketStats')
+    rows = (
+        Ticket.objects.order_by()
+        .values('user_id')
+        .annotate(
+            created_tickets=Count('id', filter=Q(status='CREATED')),
+            completed_tickets=Count('id', filter=Q(status='COMPLETED')),
+            requested_images=Sum('num_images'),
+            uploaded_images=Sum('uploaded_images'),
+        )
+    )
+    TicketStats.objects.bulk_create(
+        [TicketStats(**row) for row in rows], batch_size=BATCH_SIZE
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0009_ticket_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(backfill_ticket_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,132 @@
+from django.db import migrations
+
+# The search index lives outside the ORM: PostgreSQL keeps a tsvector column
+# up to date through a trigger, SQLite an FTS5 table through triggers. Other
+# databases fall back to substring matching.
+#
+# On PostgreSQL the column is added without a default and filled in batches,
+# and the index built concurrently, so the table is never locked for longer
+# than a batch. Rows written meanwhile are filled by the trigger.
+BACKFILL_BATCH_SIZE = 5000
+
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE api_ticket ADD COLUMN IF NOT EXISTS search_vector tsvector',
+    """
+    CREATE OR REPLACE FUNCTION api_ticket_search_vector(title text, description text)
+    RETURNS tsvector LANGUAGE sql IMMUTABLE AS $$
+        SELECT setweight(to_tsvector('english', coalesce(title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce(description, '')), 'B')
+    $$
+    """,
+    """
+    CREATE OR REPLACE FUNCTION api_ticket_search_vector_update()
+    RETURNS trigger LANGUAGE plpgsql AS $$
+    BEGIN
+        NEW.search_vector := api_ticket_search_vector(NEW.title, NEW.description);
+        RETURN NEW;
+    END
+    $$
+    """,
+    'DROP TRIGGER IF EXISTS api_ticket_search_vector_update ON api_ticket',
+    """
+    CREATE TRIGGER api_ticket_search_vector_update
+    BEFORE INSERT OR UPDATE OF title, description ON api_ticket
+    FOR EACH ROW EXECUTE PROCEDURE api_ticket_search_vector_update()
+    """,
+]
+POSTGRESQL_BACKFILL = """
+    UPDATE api_ticket
+    SET search_vector = api_ticket_search_vector(title, description)
+    WHERE id > %s AND id <= %s AND search_vector IS NULL
+"""
+POSTGRESQL_INDEX = [
+    'DROP INDEX CONCURRENTLY IF EXISTS ticket_search_vector_idx',
+    'CREATE INDEX CONCURRENTLY ticket_search_vector_idx '
+    'ON api_ticket USING GIN (search_vector)',
+]
+POSTGRESQL_REVERSE = [
+    'DROP INDEX CONCURRENTLY IF EXISTS ticket_search_vector_idx',
+    'DROP TRIGGER IF EXISTS api_ticket_search_vector_update ON api_ticket',
+    'DROP FUNCTION IF EXISTS api_ticket_search_vector_update()',
+    'DROP FUNCTION IF EXISTS api_ticket_search_vector(text, text)',
+    'ALTER TABLE api_ticket DROP COLUMN IF EXISTS search_vector',
+]
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE api_ticket_search USING fts5(
+        title, description, content='api_ticket', content_rowid='id'
+    )
+    """,
+    """
+    CREATE TRIGGER api_ticket_search_insert AFTER INSERT ON api_ticket BEGIN
+        INSERT INTO api_ticket_search (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    """
+    CREATE TRIGGER api_ticket_search_delete AFTER DELETE ON api_ticket BEGIN
+        INSERT INTO api_ticket_search (api_ticket_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+    END
+    """,
+    """
+    CREATE TRIGGER api_ticket_search_update
+    AFTER UPDATE OF title, description ON api_ticket BEGIN
+        INSERT INTO api_ticket_search (api_ticket_search, rowid, title, description)
+        VALUES ('delete', old.id, old.title, old.description);
+        INSERT INTO api_ticket_search (rowid, title, description)
+        VALUES (new.id, new.title, new.description);
+    END
+    """,
+    "INSERT INTO api_ticket_search (api_ticket_search) VALUES ('rebuild')",
+]
+SQLITE_REVERSE = [
+    'DROP TRIGGER IF EXISTS api_ticket_search_insert',
+    'DROP TRIGGER IF EXISTS api_ticket_search_delete',
+    'DROP TRIGGER IF EXISTS api_ticket_search_update',
+    'DROP TABLE IF EXISTS api_ticket_search',
+]
+
+
+def run_statements(statements):
+    def run(apps, schema_editor):
+        for statement in statements.get(schema_editor.connection.vendor, []):
+            schema_editor.execute(statement)
+
+    return run
+
+
+def backfill_search_vector(apps, schema_editor):
+    if schema_editor.connection.vendor != 'postgresql':
+        return
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute('SELECT max(id) FROM api_ticket')
+        (max_id,) = cursor.fetchone()
+        # Each batch is committed on its own, as the migration isn't atomic
+        for start in range(0, max_id or 0, BACKFILL_BATCH_SIZE):
+            cursor.execute(POSTGRESQL_BACKFILL, [start, start + BACKFILL_BATCH_SIZE])
+
+
+class Migration(migrations.Migration):
+    # The backfill commits per batch and the index is built concurrently
+    atomic = False
+
+    dependencies = [
+        ('api', '0010_backfill_ticket_stats'),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            run_statements(
+                {'postgresql': POSTGRESQL_FORWARD, 'sqlite': SQLITE_FORWARD}
+            ),
+            run_statements(
+                {'postgresql': POSTGRESQL_REVERSE, 'sqlite': SQLITE_REVERSE}
+            ),
+        ),
+        migrations.RunPython(backfill_search_vector, migrations.RunPython.noop),
+        migrations.RunPython(
+            run_statements({'postgresql': POSTGRESQL_INDEX}),
+            migrations.RunPython.noop,
+        ),
+    ]
@@ -0,0 +1,34 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:33
+
+import django.db.models.deletion
+from django.db import migrations, models
+
+from api.operations import AddIndexConcurrently
+
+
+class Migration(migrations.Migration):
+    # Indexes are built without blocking writes to the table
+    atomic = False
+
+    dependencies = [
+        ("api", "0011_ticket_search"),
+    ]
+
+    operations = [
+        AddIndexConcurrently(
+            model_name="image",
+            index=models.Index(
+                fields=["ticket", "uploaded_at", "id"], name="image_ticket_uploaded_idx"
+            ),
+        ),
+        migrations.AlterField(
+            model_name="image",
+            name="ticket",
+            field=models.ForeignKey(
+                db_index=False,
+                on_delete=django.db.models.deletion.CASCADE,
+                related_name="images",
+                to="api.ticket",
+            ),
+        ),
+    ]
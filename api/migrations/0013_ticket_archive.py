@@ -0,0 +1,80 @@
+# Generated by Django 5.0.4 on 2026-10-18 06:36
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("api", "0012_image_ticket_uploaded_index"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="ArchivedTicket",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("title", models.CharField(max_length=100)),
+                ("description", models.TextField()),
+                (
+                    "status",
+                    models.CharField(
+                        choices=[("CREATED", "Created"), ("COMPLETED", "Completed")],
+                        max_length=20,
+                    ),
+                ),
+                ("created_at", models.DateTimeField()),
+                ("updated_at", models.DateTimeField()),
+                ("num_images", models.PositiveIntegerField()),
+                ("uploaded_images", models.PositiveIntegerField(default=0)),
+                ("archived_at", models.DateTimeField(auto_now_add=True)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "ordering": ["-id"],
+            },
+        ),
+        migrations.CreateModel(
+            name="ArchivedImage",
+            fields=[
+                ("id", models.BigIntegerField(primary_key=True, serialize=False)),
+                ("cloudinary_url", models.URLField()),
+                ("uploaded_at", models.DateTimeField()),
+                ("content_hash", models.CharField(blank=True, max_length=64)),
+                ("staged_key", models.CharField(blank=True, max_length=100)),
+                ("original_size", models.PositiveIntegerField(null=True)),
+                ("uploaded_size", models.PositiveIntegerField(null=True)),
+                (
+                    "ticket",
+                    models.ForeignKey(
+                        db_index=False,
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="images",
+                        to="api.archivedticket",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="archivedticket",
+            index=models.Index(
+                fields=["user", "-id"], name="archived_ticket_user_id_idx"
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="archivedimage",
+            index=models.Index(
+                fields=["ticket", "uploaded_at", "id"], name="archived_image_ticket_idx"
+            ),
+        ),
+    ]
@@ -5,24 +5,134 @@ from django.contrib.auth.models import User
 class Ticket(models.Model):
     class Meta:
         ordering = ['-id']
+        # Tickets are always read per user; the composite indexes cover the
+        # list ordering and every supported filter, so the single-column
+        # index on user_id is not needed.
+        indexes = [
+            models.Index(fields=['user', '-id'], name='ticket_user_id_idx'),
+            models.Index(
+                fields=['user', 'status', '-id'], name='ticket_user_status_id_idx'
+            ),
+            models.Index(fields=['user', 'created_at'], name='ticket_user_created_idx'),
+            models.Index(fields=['user', 'updated_at'], name='ticket_user_updated_idx'),
+        ]
 
     STATUS_CHOICES = (
         ('CREATED', 'Created'),
         ('COMPLETED', 'Completed'),
     )
-    user = models.ForeignKey(User, on_delete=models.CASCADE)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
     title = models.CharField(max_length=100)
     description = models.TextField()
     status = models.CharField(max_length=20, choices=STATUS_CHOICES, default='CREATED')
     created_at = models.DateTimeField(auto_now_add=True)
     updated_at = models.DateTimeField(auto_now=True)
     num_images = models.PositiveIntegerField()
+    # Kept in sync by the upload task with F() updates instead of counting images
+    uploaded_images = models.PositiveIntegerField(default=0)
 
     def __str__(self):
         return self.title
 
 
 class Image(models.Model):
-    ticket = models.ForeignKey(Ticket, related_name='images', on_delete=models.CASCADE)
+    class Meta:
+        # Images are listed per ticket in upload order; the composite index
+        # also serves every other lookup by ticket
+        indexes = [
+            models.Index(
+                fields=['ticket', 'uploaded_at', 'id'], name='image_ticket_uploaded_idx'
+            ),
+            models.Index(fields=['content_hash'], name='image_content_hash_idx'),
+        ]
+        constraints = [
+            # A staged file is stored once, however often its job is retried
+            models.UniqueConstraint(
+                fields=['ticket', 'staged_key'],
+                condition=~models.Q(staged_key=''),
+                name='image_unique_ticket_staged_key',
+            ),
+        ]
+
+    ticket = models.ForeignKey(
+        Ticket, related_name='images', on_delete=models.CASCADE, db_index=False
+    )
     cloudinary_url = models.URLField()
     uploaded_at = models.DateTimeField(auto_now_add=True)
+    # SHA-256 of the file as received; identical files reuse the same upload
+    content_hash = models.CharField(max_length=64, blank=True)
+    # Key of the staged file the image was stored from
+    staged_key = models.CharField(max_length=100, blank=True)
+    # Sizes in bytes as received and as uploaded (0 when an earlier upload of
+    # the same content was reused), to measure the savings
+    original_size = models.PositiveIntegerField(null=True)
+    uploaded_size = models.PositiveIntegerField(null=True)
+
+
+class ArchivedTicket(models.Model):
+    """
+    COMPLETED tickets moved out of Ticket by the archive_tickets command,
+    keeping their ids, so the hot table and its indexes stay small.
+    """
+
+    class Meta:
+        ordering = ['-id']
+        indexes = [
+            models.Index(fields=['user', '-id'], name='archived_ticket_user_id_idx'),
+        ]
+
+    id = models.BigIntegerField(primary_key=True)
+    user = models.ForeignKey(User, on_delete=models.CASCADE, db_index=False)
+    title = models.CharField(max_length=100)
+    description = models.TextField()
+    status = models.CharField(max_length=20, choices=Ticket.STATUS_CHOICES)
+    created_at = models.DateTimeField()
+    updated_at = models.DateTimeField()
+    num_images = models.PositiveIntegerField()
+    uploaded_images = models.PositiveIntegerField(default=0)
+    archived_at = models.DateTimeField(auto_now_add=True)
+
+    def __str__(self):
+        return self.title
+
+
+class ArchivedImage(models.Model):
+    """Images of archived tickets, moved along with them."""
+
+    class Meta:
+        indexes = [
+            models.Index(
+                fields=['ticket', 'uploaded_at', 'id'],
+                name='archived_image_ticket_idx',
+            ),
+        ]
+
+    id = models.BigIntegerField(primary_key=True)
+    ticket = models.ForeignKey(
+        ArchivedTicket,
+        related_name='images',
+        on_delete=models.CASCADE,
+        db_index=False,
+    )
+    cloudinary_url = models.URLField()
+    uploaded_at = models.DateTimeField()
+    content_hash = models.CharField(max_length=64, blank=True)
+    staged_key = models.CharField(max_length=100, blank=True)
+    original_size = models.PositiveIntegerField(null=True)
+    uploaded_size = models.PositiveIntegerField(null=True)
+
+
+class TicketStats(models.Model):
+    # Counters per user, updated with F() expressions alongside the ticket
+    # changes so the stats are read without counting tickets
+    user = models.OneToOneField(
+        User, primary_key=True, related_name='ticket_stats', on_delete=models.CASCADE
+    )
+    created_tickets = models.PositiveIntegerField(default=0)
+    completed_tickets = models.PositiveIntegerField(default=0)
+    requested_images = models.PositiveIntegerField(default=0)
+    uploaded_images = models.PositiveIntegerField(default=0)
+
+    @property
+    def total_tickets(self):
+        return self.created_tickets + self.completed_tickets
@@ -0,0 +1,65 @@
+from django.contrib.postgres import operations as postgres_operations
+from django.db.migrations import AddConstraint, AddIndex
+
+
+class AddIndexConcurrently(postgres_operations.AddIndexConcurrently):
+    """
+    Build the index with CREATE INDEX CONCURRENTLY on PostgreSQL, so writes
+    to the table go on while it is built, and as a plain index elsewhere,
+    e.g. on SQLite. Migrations using it must set ``atomic = False``.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_forwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_forwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        if schema_editor.connection.vendor == 'postgresql':
+            super().database_backwards(app_label, schema_editor, from_state, to_state)
+        else:
+            AddIndex.database_backwards(
+                self, app_label, schema_editor, from_state, to_state
+            )
+
+
+class AddUniqueConstraintConcurrently(AddConstraint):
+    """
+    Add a conditional UniqueConstraint, which PostgreSQL stores as a partial
+    unique index, with CREATE UNIQUE INDEX CONCURRENTLY so writes to the
+    table go on while it is built, and as a plain constraint elsewhere.
+    Migrations using it must set ``atomic = False``.
+    """
+
+    def database_forwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_forwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            sql = str(self.constraint.create_sql(model, schema_editor))
+            if not sql.startswith('CREATE UNIQUE INDEX '):
+                raise ValueError(
+                    f'{self.constraint.name} is not created as a unique index.'
+                )
+            schema_editor.execute(
+                sql.replace(
+                    'CREATE UNIQUE INDEX', 'CREATE UNIQUE INDEX CONCURRENTLY', 1
+                )
+            )
+
+    def database_backwards(self, app_label, schema_editor, from_state, to_state):
+        model = to_state.apps.get_model(app_label, self.model_name)
+        if schema_editor.connection.vendor != 'postgresql':
+            return super().database_backwards(
+                app_label, schema_editor, from_state, to_state
+            )
+        if self.allow_migrate_model(schema_editor.connection.alias, model):
+            schema_editor.execute(
+                'DROP INDEX CONCURRENTLY IF EXISTS %s'
+                % schema_editor.quote_name(self.constraint.name)
+            )
@@ -0,0 +1,312 @@
+import json
+import logging
+import threading
+import time
+import uuid
+from functools import lru_cache
+
+import django_rq
+from django.conf import settings
+from rq.job import Job
+
+from .metrics import observe_stage
+
+logger = logging.getLogger(__name__)
+
+
+# Adds a job to the list of its share in a lane. A share joining the lane
+# starts at the lane's current virtual time, or where it left off if later.
+SUBMIT_SCRIPT = """
+local pending, turns, clock, finish = KEYS[1], KEYS[2], KEYS[3], KEYS[4]
+local share = ARGV[1]
+redis.call('RPUSH', pending, ARGV[2])
+if not redis.call('ZSCORE', turns, share) then
+    local turn = math.max(
+        tonumber(redis.call('GET', clock) or 0),
+        tonumber(redis.call('HGET', finish, share) or 0)
+    )
+    redis.call('ZADD', turns, tostring(turn), share)
+end
+"""
+
+# Frees the slots of expired jobs, then takes jobs off the lanes while there
+# are free slots, and takes their slots. Returns the ids and payloads of the
+# jobs taken, to be enqueued; the payloads are also kept until they are, and
+# the slots of jobs not enqueued yet don't expire. Keys are built from the
+# prefix, as they depend on the lanes, shares and users found.
+DISPATCH_SCRIPT = """
+local prefix = ARGV[1]
+local now = tonumber(ARGV[2])
+local deadline = now + tonumber(ARGV[3])
+local max_in_flight = tonumber(ARGV[4])
+local max_in_flight_per_user = tonumber(ARGV[5])
+local scan_limit = tonumber(ARGV[6])
+local batch = ARGV[7]
+local lane_order = {}
+for i = 8, #ARGV do
+    lane_order[#lane_order + 1] = ARGV[i]
+end
+
+local function key(...)
+    return table.concat({prefix, ...}, ':')
+end
+
+local in_flight, users = key('in_flight'), key('in_flight', 'users')
+local payloads = key('in_flight', 'payloads')
+for _, job_id in ipairs(redis.call('ZRANGEBYSCORE', in_flight, '-inf', now)) do
+    if redis.call('HEXISTS', payloads, job_id) == 0 then
+        local user_id = redis.call('HGET', users, job_id)
+        redis.call('ZREM', in_flight, job_id)
+        if user_id then
+            redis.call('ZREM', key('in_flight', user_id), job_id)
+        end
+        redis.call('HDEL', users, job_id)
+    end
+end
+
+local function next_job_in_lane(lane)
+    local turns = key(lane, 'turns')
+    local entries = redis.call('ZRANGE', turns, 0, scan_limit - 1, 'WITHSCORES')
+    for i = 1, #entries, 2 do
+        local share, turn = entries[i], tonumber(entries[i + 1])
+        local pending = key(lane, 'pending', share)
+        local payload = redis.call('LINDEX', pending, 0)
+        if not payload then
+            redis.call('ZREM', turns, share)
+        else
+            local job = cjson.decode(payload)
+            local user_id = tostring(job['user_id'])
+            if redis.call('ZCARD', key('in_flight', user_id)) < max_in_flight_per_user then
+                redis.call('LPOP', pending)
+                local finish = tostring(turn + 1 / job['weight'])
+                redis.call('SET', key(lane, 'clock'), tostring(turn))
+                if redis.call('LLEN', pending) > 0 then
+                    redis.call('ZADD', turns, finish, share)
+                else
+                    -- Kept so that leaving and joining again does not skip ahead
+                    redis.call('ZREM', turns, share)
+                    redis.call('HSET', key(lane, 'finish'), share, finish)
+                end
+                return payload, user_id
+            end
+        end
+    end
+    return nil
+end
+
+local released = {}
+while redis.call('ZCARD', in_flight) < max_in_flight do
+    local start = redis.call('INCR', key('lane_turn'))
+    local visited, payload, user_id = {}, nil, nil
+    for offset = 0, #lane_order - 1 do
+        local lane = lane_order[(start + offset) % #lane_order + 1]
+        if not visited[lane] then
+            visited[lane] = true
+            payload, user_id = next_job_in_lane(lane)
+            if payload then
+                break
+            end
+        end
+    end
+    if not payload then
+        break
+    end
+    local job_id = batch .. '-' .. (#released / 2 + 1)
+    redis.call('ZADD', in_flight, deadline, job_id)
+    redis.call('ZADD', key('in_flight', user_id), deadline, job_id)
+    redis.call('HSET', users, job_id, user_id)
+    redis.call('HSET', payloads, job_id, payload)
+    released[#released + 1] = job_id
+    released[#released + 1] = payload
+end
+return released
+"""
+
+
+class UploadScheduler:
+    """
+    Releases upload jobs to the RQ queue in a fair order instead of FIFO.
+
+    Submitted jobs wait in Redis, in one list per user (or per ticket) within
+    a priority lane. Jobs are released whenever a job is submitted or
+    finishes, as long as fewer than ``max_in_flight`` released jobs are
+    queued or running, and fewer than ``max_in_flight_per_user`` for the
+    user. Lanes are visited in proportion to their weights, so busy lanes
+    can't starve the others.
+
+    Within a lane, users take turns in weighted fair order: each has a
+    virtual time that advances by ``1 / weight`` for every job released, and
+    the user with the lowest one goes next. Users joining start at the
+    current virtual time of the lane, so waiting does not earn extra turns.
+
+    Released jobs hold their slot until they finish or their ``lease``
+    expires, in case the worker running them dies. Their payload is kept
+    until they are enqueued, and ``recover`` enqueues those that never were,
+    e.g. because Redis failed or the process releasing them died.
+
+    Jobs are submitted and selected by Lua scripts, so processes don't wait
+    on each other or make a round trip per waiting user. At most
+    ``scan_limit`` users are looked at per lane for each job released.
+    """
+
+    prefix = 'uploads'
+    scan_limit = 100
+    recover_after = 60
+
+    def __init__(
+        self,
+        queue=None,
+        lanes=None,
+        max_in_flight=None,
+        max_in_flight_per_user=None,
+        fair_share=None,
+        lease=None,
+    ):
+        self.queue = queue or django_rq.get_queue('default')
+        self.connection = self.queue.connection
+        lanes = lanes or settings.UPLOAD_SCHEDULER_LANES
+        self.lanes = list(lanes)
+        # Lanes repeated by weight, e.g. [high, high, high, default]
+        self.lane_order = [
+            lane for lane, weight in lanes.items() for _ in range(weight)
+        ]
+        self.max_in_flight = max_in_flight or settings.UPLOAD_SCHEDULER_MAX_IN_FLIGHT
+        self.max_in_flight_per_user = (
+            max_in_flight_per_user or settings.UPLOAD_SCHEDULER_MAX_IN_FLIGHT_PER_USER
+        )
+        self.fair_share = fair_share or settings.UPLOAD_SCHEDULER_FAIR_SHARE
+        self.lease = lease or settings.UPLOAD_SCHEDULER_LEASE
+        self._local = threading.local()
+        self.submit_script = self.connection.register_script(SUBMIT_SCRIPT)
+        self.dispatch_script = self.connection.register_script(DISPATCH_SCRIPT)
+
+    def key(self, *parts):
+        return ':'.join([self.prefix, *map(str, parts)])
+
+    def get_lane(self, ticket, staged_images):
+        # Jobs that complete their ticket, or are small, go first
+        remaining = ticket.num_images - ticket.uploaded_images
+        size = sum(staged_image['size'] for staged_image in staged_images)
+        if (
+            len(staged_images) >= remaining
+            or size <= settings.UPLOAD_SCHEDULER_SMALL_JOB_BYTES
+        ):
+            return self.lanes[0]
+        return self.lanes[-1]
+
+    def submit(self, ticket, staged_images, lane=None, weight=1):
+        lane = lane or self.get_lane(ticket, staged_images)
+        share = ticket.user_id if self.fair_share == 'user' else ticket.id
+        payload = json.dumps(
+            {
+                'ticket_id': ticket.id,
+                'user_id': ticket.user_id,
+                'staged_images': staged_images,
+                'weight': weight,
+                'submitted_at': time.time(),
+            }
+        )
+        self.submit_script(
+            keys=[
+                self.key(lane, 'pending', share),
+                self.key(lane, 'turns'),
+                self.key(lane, 'clock'),
+                self.key(lane, 'finish'),
+            ],
+            args=[share, payload],
+        )
+        self.dispatch()
+
+    def job_finished(self, job_id):
+        user_id = self.connection.hget(self.key('in_flight', 'users'), job_id)
+        if user_id is not None:
+            self.release_slot(job_id, user_id.decode())
+        self.dispatch()
+
+    def dispatch(self):
+        # Jobs that run synchronously finish while this thread is dispatching;
+        # the loop below picks up the freed slots
+        if getattr(self._local, 'dispatching', False):
+            return
+        self._local.dispatching = True
+        try:
+            while released := self.dispatch_script(
+                args=[
+                    self.prefix,
+                    time.time(),
+                    self.lease,
+                    self.max_in_flight,
+                    self.max_in_flight_per_user,
+                    self.scan_limit,
+                    uuid.uuid4().hex,
+                    *self.lane_order,
+                ]
+            ):
+                for job_id, payload in zip(released[::2], released[1::2]):
+                    job_id = job_id.decode()
+                    try:
+                        self.release(job_id, payload)
+                    except Exception:
+                        # Left in flight for recover() to enqueue
+                        logger.exception('Could not enqueue upload job %s', job_id)
+        finally:
+            self._local.dispatching = False
+
+    def release(self, job_id, payload):
+        job = json.loads(payload)
+        # Time spent waiting in the lanes, before the job is enqueued
+        if 'submitted_at' in job:
+            observe_stage('scheduler_wait', time.time() - job['submitted_at'])
+        self.queue.enqueue_call(
+            'api.tasks.upload_images_to_cloudinary',
+            args=(job['staged_images'], job['ticket_id']),
+            job_id=job_id,
+        )
+        self.connection.hdel(self.key('in_flight', 'payloads'), job_id)
+
+    def recover(self):
+        """
+        Enqueues released jobs that never reached the queue. Jobs released
+        less than ``recover_after`` seconds ago are left alone, as they may
+        still be on their way.
+        """
+        payloads = self.key('in_flight', 'payloads')
+        now = time.time()
+        for job_id, payload in self.connection.hgetall(payloads).items():
+            job_id = job_id.decode()
+            deadline = self.connection.zscore(self.key('in_flight'), job_id)
+            if (
+                deadline is not None
+                and deadline - self.lease > now - self.recover_after
+            ):
+                continue
+            if Job.exists(job_id, connection=self.connection):
+                # Enqueued, but the payload was not removed
+                self.connection.hdel(payloads, job_id)
+                continue
+            user_id = self.connection.hget(self.key('in_flight', 'users'), job_id)
+            if user_id is not None:
+                # The lease starts when the job is enqueued
+                with self.connection.pipeline() as pipeline:
+                    pipeline.zadd(self.key('in_flight'), {job_id: now + self.lease})
+                    pipeline.zadd(
+                        self.key('in_flight', user_id.decode()),
+                        {job_id: now + self.lease},
+                    )
+                    pipeline.execute()
+            try:
+                self.release(job_id, payload)
+            except Exception:
+                logger.exception('Could not enqueue upload job %s', job_id)
+
+    def release_slot(self, job_id, user_id):
+        with self.connection.pipeline() as pipeline:
+            pipeline.zrem(self.key('in_flight'), job_id)
+            pipeline.zrem(self.key('in_flight', user_id), job_id)
+            pipeline.hdel(self.key('in_flight', 'users'), job_id)
+            pipeline.execute()
+
+
+@lru_cache
+def get_upload_scheduler():
+    return UploadScheduler()
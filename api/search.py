@@ -0,0 +1,54 @@
+import re
+
+from django.contrib.postgres.search import SearchQuery, SearchRank, SearchVectorField
+from django.db import connections
+from django.db.models import FloatField, Q
+from django.db.models.expressions import RawSQL
+
+from .models import Ticket
+
+# Text search configuration of the search_vector column (migration 0011)
+SEARCH_CONFIG = 'english'
+
+
+def search_tickets(queryset, query):
+    """
+    Filter tickets matching the words of ``query``, annotated with a
+    ``rank`` and ordered best match first. Titles weigh more than
+    descriptions.
+    """
+    # Only the hot table is indexed; archived tickets are searched by a scan
+    vendor = connections[queryset.db].vendor if queryset.model is Ticket else None
+    if vendor == 'postgresql':
+        search_query = SearchQuery(query, config=SEARCH_CONFIG, search_type='websearch')
+        vector = RawSQL(
+            '"api_ticket"."search_vector"', [], output_field=SearchVectorField()
+        )
+        queryset = (
+            queryset.alias(search_vector=vector)
+            .filter(search_vector=search_query)
+            .annotate(rank=SearchRank(vector, search_query))
+        )
+    elif vendor == 'sqlite':
+        # Quote every word so user input can't use the FTS5 query syntax
+        words = ['"%s"' % word for word in re.findall(r'\w+', query)]
+        if not words:
+            return queryset.none()
+        match = ' '.join(words)
+        matching_ids = RawSQL(
+            'SELECT rowid FROM api_ticket_search WHERE api_ticket_search MATCH %s',
+            [match],
+        )
+        # bm25() is lower for better matches
+        rank = RawSQL(
+            'SELECT -bm25(api_ticket_search, 2.0, 1.0) FROM api_ticket_search '
+            'WHERE api_ticket_search MATCH %s AND rowid = "api_ticket"."id"',
+            [match],
+            output_field=FloatField(),
+        )
+        queryset = queryset.filter(id__in=matching_ids).annotate(rank=rank)
+    else:
+        return queryset.filter(
+            Q(title__icontains=query) | Q(description__icontains=query)
+        )
+    return queryset.order_by('-rank', '-id')
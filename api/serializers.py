@@ -1,9 +1,29 @@
-from django.forms import ValidationError
-from rest_framework import serializers
+from rest_framework import ISO_8601, serializers
+from rest_framework.reverse import reverse
+from rest_framework.settings import api_settings
+from django.conf import settings
 from django.contrib.auth.models import User
-from .models import Ticket, Image
+from django.utils import timezone
+from .models import ArchivedTicket, Ticket, TicketStats, Image
+from .utils import IMAGE_SIGNATURE_LENGTH, sniff_image_format
 
 MAX_FILE_SIZE_MB = 10  # Maximum file size allowed in megabytes
+MAX_FILE_SIZE_BYTES = MAX_FILE_SIZE_MB * 1024 * 1024
+ALLOWED_IMAGE_FORMATS = ['jpg', 'jpeg', 'png', 'gif']
+MAX_IMAGES_PER_REQUEST = 20  # Maximum number of images in a batch upload
+MAX_TICKETS_PER_REQUEST = 1000  # Maximum number of tickets in a bulk create
+BULK_CREATE_BATCH_SIZE = 500  # Rows per INSERT when creating tickets in bulk
+MAX_UPLOAD_SIZE_MB = 100  # Maximum size of all the images of a request
+MAX_UPLOAD_SIZE_BYTES = MAX_UPLOAD_SIZE_MB * 1024 * 1024
+MAX_EMBEDDED_IMAGES = 20  # Images embedded per ticket in ticket lists
+FILE_SIZE_ERROR = f"File size exceeds the maximum limit of {MAX_FILE_SIZE_MB} MB."
+FILE_COUNT_ERROR = (
+    f"No more than {MAX_IMAGES_PER_REQUEST} images can be uploaded at once."
+)
+UPLOAD_SIZE_ERROR = (
+    f"Images exceed the maximum limit of {MAX_UPLOAD_SIZE_MB} MB in total."
+)
+FILE_FORMAT_ERROR = f"Only {', '.join(ALLOWED_IMAGE_FORMATS)} formats are allowed."
 
 
 class UserSerializer(serializers.ModelSerializer):
@@ -19,9 +39,19 @@ class UserSerializer(serializers.ModelSerializer):
         return user
 
 
+class TicketListSerializer(serializers.ListSerializer):
+    def create(self, validated_data):
+        # One INSERT per batch instead of one per ticket, all in one transaction
+        return Ticket.objects.bulk_create(
+            [Ticket(**attrs) for attrs in validated_data],
+            batch_size=BULK_CREATE_BATCH_SIZE,
+        )
+
+
 class TicketSerializer(serializers.ModelSerializer):
     class Meta:
         model = Ticket
+        list_serializer_class = TicketListSerializer
         fields = [
             'id',
             'title',
@@ -33,12 +63,104 @@ class TicketSerializer(serializers.ModelSerializer):
         ]
         read_only_fields = ['status', 'created_at', 'updated_at']
 
+    def __init__(self, *args, fields=None, include=(), **kwargs):
+        # Sparse fieldsets: only the given fields, plus the related data
+        # named in include, which the queryset should prefetch
+        super().__init__(*args, **kwargs)
+        if fields is not None:
+            for name in set(self.fields) - set(fields):
+                self.fields.pop(name)
+        if 'images' in include:
+            # The first MAX_EMBEDDED_IMAGES, prefetched as embedded_images;
+            # all of them are listed page by page at images_url
+            self.fields['images'] = ImageSerializer(
+                many=True, read_only=True, source='embedded_images'
+            )
+            self.fields['images_url'] = serializers.SerializerMethodField()
+
+    def get_images_url(self, ticket):
+        url = reverse(
+            'ticket_images',
+            kwargs={'ticket_id': ticket.id},
+            request=self.context.get('request'),
+        )
+        return f'{url}?archived=true' if isinstance(ticket, ArchivedTicket) else url
+
     def validate_num_images(self, value):
         if value < 1:
             raise serializers.ValidationError("Number of images must be at least 1.")
         return value
 
 
+def make_datetime_formatter():
+    """
+    Return a function formatting datetimes like DateTimeField, with the
+    output format and time zone looked up once instead of per value.
+    """
+    if not settings.USE_TZ or (api_settings.DATETIME_FORMAT or '').lower() != ISO_8601:
+        return serializers.DateTimeField().to_representation
+    tz = timezone.get_current_timezone()
+
+    def format_datetime(value):
+        if not value:
+            return None
+        value = value.astimezone(tz).isoformat()
+        if value.endswith('+00:00'):
+            value = value[:-6] + 'Z'
+        return value
+
+    return format_datetime
+
+
+class TicketValuesSerializer:
+    """
+    Turns rows of ``Ticket.objects.values(*fields)`` into the representation
+    of TicketSerializer, without model instances or field objects. Rows are
+    changed in place, except that the id, always read as pagination needs it,
+    is left out of copies when it isn't asked for, as the paginator reads it
+    from its rows to build the page links.
+    """
+
+    fields = TicketSerializer.Meta.fields
+    datetime_fields = ['created_at', 'updated_at']
+
+    def __init__(self, fields=None):
+        if fields is not None:
+            self.fields = fields
+
+    @property
+    def columns(self):
+        return self.fields if 'id' in self.fields else ['id', *self.fields]
+
+    def to_representation(self, rows):
+        return list(self.iter_representation(rows))
+
+    def iter_representation(self, rows):
+        format_datetime = make_datetime_formatter()
+        datetime_fields = [
+            field for field in self.datetime_fields if field in self.fields
+        ]
+        drop_id = 'id' not in self.fields
+        for row in rows:
+            if drop_id:
+                row = {field: value for field, value in row.items() if field != 'id'}
+            for field in datetime_fields:
+                row[field] = format_datetime(row[field])
+            yield row
+
+
+class TicketStatsSerializer(serializers.ModelSerializer):
+    class Meta:
+        model = TicketStats
+        fields = [
+            'total_tickets',
+            'created_tickets',
+            'completed_tickets',
+            'requested_images',
+            'uploaded_images',
+        ]
+
+
 class ImageSerializer(serializers.ModelSerializer):
     class Meta:
         model = Image
@@ -46,29 +168,42 @@ class ImageSerializer(serializers.ModelSerializer):
         read_only_fields = ['id', 'created_at']
 
 
-class ImageUploadSerializer(serializers.Serializer):
-    image = serializers.ImageField()
+class ImageFileField(serializers.FileField):
+    """
+    File field for uploaded images. The format is checked from the leading
+    bytes instead of decoding the whole image with Pillow.
+    """
 
-    def validate_image(self, value):
+    def to_internal_value(self, data):
+        value = super().to_internal_value(data)
         self.validate_file_size(value)
         self.validate_file_format(value)
         return value
 
     def validate_file_size(self, value):
         # Check if file size exceeds the maximum allowed size
-        max_size_bytes = MAX_FILE_SIZE_MB * 1024 * 1024  # Convert MB to bytes
-        if value.size > max_size_bytes:
-            raise ValidationError(
-                f"File size exceeds the maximum limit of {MAX_FILE_SIZE_MB} MB."
-            )
+        if value.size > MAX_FILE_SIZE_BYTES:
+            raise serializers.ValidationError(FILE_SIZE_ERROR)
 
     def validate_file_format(self, value):
         # Get the file extension
         ext = value.name.split('.')[-1].lower()
-        # Define allowed image formats
-        allowed_formats = ['jpg', 'jpeg', 'png', 'gif']
-        # Validate if the file format is allowed
-        if ext not in allowed_formats:
-            raise ValidationError(
-                f"Only {', '.join(allowed_formats)} formats are allowed."
-            )
+        # Validate the extension and the magic bytes of the content
+        if ext not in ALLOWED_IMAGE_FORMATS:
+            raise serializers.ValidationError(FILE_FORMAT_ERROR)
+        header = value.read(IMAGE_SIGNATURE_LENGTH)
+        value.seek(0)
+        if sniff_image_format(header) is None:
+            raise serializers.ValidationError(FILE_FORMAT_ERROR)
+
+
+class ImageUploadSerializer(serializers.Serializer):
+    image = ImageFileField()
+
+
+class ImageBatchUploadSerializer(serializers.Serializer):
+    images = serializers.ListField(
+        child=ImageFileField(),
+        allow_empty=False,
+        max_length=MAX_IMAGES_PER_REQUEST,
+    )
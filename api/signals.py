@@ -0,0 +1,33 @@
+from django.contrib.auth.models import User
+from django.db import transaction
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+from rest_framework.authtoken.models import Token
+
+from .cache import invalidate_ticket, invalidate_token
+from .models import Ticket
+
+
+@receiver(post_save, sender=Token)
+@receiver(post_delete, sender=Token)
+def invalidate_cached_token(sender, instance, **kwargs):
+    invalidate_token(instance.key)
+
+
+@receiver(post_save, sender=User)
+def invalidate_cached_user_tokens(sender, instance, created, **kwargs):
+    # Deactivated or otherwise changed users must not be served from the cache
+    if created:
+        return
+    for key in Token.objects.filter(user=instance).values_list('key', flat=True):
+        invalidate_token(key)
+
+
+@receiver(post_save, sender=Ticket)
+@receiver(post_delete, sender=Ticket)
+def invalidate_cached_ticket(sender, instance, **kwargs):
+    # Again after the commit, or a request could cache the ticket as it was
+    # before it
+    pk = instance.pk
+    invalidate_ticket(pk)
+    transaction.on_commit(lambda: invalidate_ticket(pk))
@@ -0,0 +1,47 @@
+import hashlib
+import uuid
+
+from django.core.files.base import File
+from django.core.files.storage import storages
+
+STAGING_STORAGE_ALIAS = 'staging'
+
+
+class HashingFile(File):
+    """File wrapper that computes a SHA-256 digest while its chunks are read."""
+
+    def __init__(self, file, name=None):
+        super().__init__(file, name)
+        self.sha256 = hashlib.sha256()
+
+    def chunks(self, chunk_size=None):
+        for chunk in super().chunks(chunk_size):
+            self.sha256.update(chunk)
+            yield chunk
+
+
+def get_staging_storage():
+    return storages[STAGING_STORAGE_ALIAS]
+
+
+def stage_image(image, ticket_id):
+    """
+    Stream an uploaded image into the staging storage and return a small,
+    picklable reference to it that can be passed to a background job.
+    """
+    storage = get_staging_storage()
+    content = HashingFile(image)
+    key = storage.save(f'tickets/{ticket_id}/{uuid.uuid4().hex}', content)
+    return {
+        'key': key,
+        'size': image.size,
+        'sha256': content.sha256.hexdigest(),
+    }
+
+
+def open_staged_image(staged_image):
+    return get_staging_storage().open(staged_image['key'], 'rb')
+
+
+def discard_staged_image(staged_image):
+    get_staging_storage().delete(staged_image['key'])
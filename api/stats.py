@@ -0,0 +1,67 @@
+from django.db import IntegrityError, transaction
+from django.db.models import Count, F, Q, Sum
+from django.db.models.functions import Greatest
+
+from .models import ArchivedTicket, Ticket, TicketStats
+
+BATCH_SIZE = 1000
+
+
+def update_ticket_stats(queryset, **deltas):
+    # Counters can drift, e.g. for tickets created outside the API views, so
+    # decrements stop at 0 rather than fail the transaction they run in
+    return queryset.update(
+        **{
+            field: F(field) + delta if delta >= 0 else Greatest(F(field) + delta, 0)
+            for field, delta in deltas.items()
+        }
+    )
+
+
+def record_tickets_created(user_id, tickets):
+    deltas = {
+        'created_tickets': len(tickets),
+        'requested_images': sum(ticket.num_images for ticket in tickets),
+    }
+    stats = TicketStats.objects.filter(user_id=user_id)
+    if update_ticket_stats(stats, **deltas):
+        return
+    # The first tickets of the user create the row
+    try:
+        with transaction.atomic():
+            TicketStats.objects.create(user_id=user_id, **deltas)
+    except IntegrityError:
+        # Another request created it first
+        update_ticket_stats(stats, **deltas)
+
+
+def record_images_uploaded(ticket_id, count, completed):
+    deltas = {'uploaded_images': count}
+    if completed:
+        deltas.update(created_tickets=-1, completed_tickets=1)
+    update_ticket_stats(TicketStats.objects.filter(user__ticket=ticket_id), **deltas)
+
+
+def rebuild_ticket_stats():
+    """Recount the stats of every user from the tickets and archive tables."""
+    counters = {
+        'created_tickets': Count('id', filter=Q(status='CREATED')),
+        'completed_tickets': Count('id', filter=Q(status='COMPLETED')),
+        'requested_images': Sum('num_images'),
+        'uploaded_images': Sum('uploaded_images'),
+    }
+    stats = {}
+    for model in (Ticket, ArchivedTicket):
+        for row in model.objects.order_by().values('user_id').annotate(**counters):
+            user_stats = stats.setdefault(
+                row['user_id'], TicketStats(user_id=row['user_id'])
+            )
+            for counter in counters:
+                setattr(
+                    user_stats, counter, getattr(user_stats, counter) + row[counter]
+                )
+    with transaction.atomic():
+        TicketStats.objects.all().delete()
+        return len(
+            TicketStats.objects.bulk_create(stats.values(), batch_size=BATCH_SIZE)
+        )
@@ -1,22 +1,162 @@
-from django_rq import job
+import time
+
+from django.conf import settings
 from django.core.files.base import ContentFile
+from django.db import IntegrityError, transaction
+from django.db.models import F, Max
+from django.utils import timezone
+from django_rq import job
+from rq import get_current_job
 
 from .utils import CloudinaryStrategy, ImageUploader
+from .cache import invalidate_ticket
+from .events import publish_ticket_event
+from .imaging import optimize_image_in_pool
+from .metrics import UPLOAD_JOBS, observe_stage, record_job_started, time_stage
 from .models import Image, Ticket
+from .scheduling import get_upload_scheduler
+from .staging import discard_staged_image, open_staged_image
+from .stats import record_images_uploaded
+
+uploader = ImageUploader(
+    CloudinaryStrategy(), max_concurrency=settings.IMAGE_UPLOAD_CONCURRENCY
+)
+
+
+def ticket_completed(ticket_id):
+    # update() bypasses the post_save signal that clears the cache
+    invalidate_ticket(ticket_id)
+    user_id = Ticket.objects.values_list('user_id', flat=True).get(pk=ticket_id)
+    publish_ticket_event(ticket_id, user_id, 'COMPLETED')
+
+
+def upload_staged_image(staged_image):
+    with open_staged_image(staged_image) as image_file:
+        with time_stage('preprocess'):
+            if settings.IMAGE_OPTIMIZATION_ENABLED:
+                image_file = ContentFile(optimize_image_in_pool(image_file.read()))
+        with time_stage('upload'):
+            image_url = uploader.upload_image(image_file)
+        return image_url, image_file.size
 
-uploader = ImageUploader(CloudinaryStrategy())
+
+def store_staged_images(staged_images, ticket_id):
+    images = {}
+    for staged_image in staged_images:
+        images.setdefault(staged_image['sha256'], staged_image)
+    # Content uploaded before, for any ticket, reuses the existing URL
+    with time_stage('dedup_lookup'):
+        known_urls = dict(
+            Image.objects.filter(content_hash__in=images)
+            .order_by()
+            .values('content_hash')
+            .annotate(url=Max('cloudinary_url'))
+            .values_list('content_hash', 'url')
+        )
+    new_hashes = [
+        content_hash for content_hash in images if content_hash not in known_urls
+    ]
+    # Optimize and upload the new images concurrently
+    uploads = dict(
+        zip(
+            new_hashes,
+            uploader.map(
+                upload_staged_image,
+                [images[content_hash] for content_hash in new_hashes],
+            ),
+        )
+    )
+    uploads.update((content_hash, (url, 0)) for content_hash, url in known_urls.items())
+    try:
+        completed = record_images(ticket_id, staged_images, uploads)
+    except IntegrityError:
+        # A concurrent retry stored some of the same files first
+        completed = record_images(ticket_id, staged_images, uploads)
+    # The staged copies are only needed until the uploads are recorded
+    for staged_image in staged_images:
+        discard_staged_image(staged_image)
+    return completed
+
+
+def record_images(ticket_id, staged_images, uploads):
+    started = time.perf_counter()
+    with transaction.atomic():
+        # Files already stored by an earlier try of the same job are not
+        # stored or counted again. Identical files uploaded separately are
+        # each stored and counted, sharing the upload.
+        stored_keys = set(
+            Image.objects.filter(
+                ticket_id=ticket_id,
+                staged_key__in=[staged_image['key'] for staged_image in staged_images],
+            ).values_list('staged_key', flat=True)
+        )
+        new_images = []
+        hashes = set()
+        for staged_image in staged_images:
+            if staged_image['key'] in stored_keys:
+                continue
+            content_hash = staged_image['sha256']
+            image_url, uploaded_size = uploads[content_hash]
+            # Only the first copy of the content was uploaded
+            if content_hash in hashes:
+                uploaded_size = 0
+            hashes.add(content_hash)
+            new_images.append(
+                Image(
+                    ticket_id=ticket_id,
+                    cloudinary_url=image_url,
+                    content_hash=content_hash,
+                    staged_key=staged_image['key'],
+                    original_size=staged_image['size'],
+                    uploaded_size=uploaded_size,
+                )
+            )
+        # Save all new image URLs to the Image model at once
+        new_images = Image.objects.bulk_create(new_images)
+        Ticket.objects.filter(pk=ticket_id).update(
+            uploaded_images=F('uploaded_images') + len(new_images)
+        )
+        # Only one worker can move the ticket out of CREATED, so concurrent
+        # jobs finishing the last images complete it exactly once.
+        completion_started = time.perf_counter()
+        completed = Ticket.objects.filter(
+            pk=ticket_id,
+            status='CREATED',
+            uploaded_images__gte=F('num_images'),
+        ).update(status='COMPLETED', updated_at=timezone.now())
+        completion_duration = time.perf_counter() - completion_started
+        if new_images or completed:
+            record_images_uploaded(ticket_id, len(new_images), completed)
+        if completed:
+            transaction.on_commit(lambda: ticket_completed(ticket_id))
+    # The DB write includes the commit, but not the completion check
+    observe_stage('completion_check', completion_duration)
+    observe_stage('db_write', time.perf_counter() - started - completion_duration)
+    return bool(completed)
+
+
+def run_upload_job(staged_images, ticket_id):
+    current_job = get_current_job()
+    if current_job is not None:
+        record_job_started(current_job)
+    try:
+        store_staged_images(staged_images, ticket_id)
+    except Exception:
+        UPLOAD_JOBS.labels('failed').inc()
+        raise
+    else:
+        UPLOAD_JOBS.labels('succeeded').inc()
+    finally:
+        # Frees the slot of the user and releases the next waiting jobs
+        if current_job is not None:
+            get_upload_scheduler().job_finished(current_job.id)
+
+
+@job('default')
+def upload_image_to_cloudinary(staged_image, ticket_id):
+    run_upload_job([staged_image], ticket_id)
 
 
 @job('default')
-def upload_image_to_cloudinary(image_bytes, ticket_id):
-    image_file = ContentFile(image_bytes)
-    # Upload image to Cloudinary
-    image_url = uploader.upload_image(image_file)
-    # Save image URL to the Image model
-    ticket = Ticket.objects.get(pk=ticket_id)
-    Image.objects.create(ticket=ticket, cloudinary_url=image_url)
-    # Check if all images for the ticket are uploaded
-    if ticket.images.count() == ticket.num_images:
-        # Update ticket status to completed
-        ticket.status = 'COMPLETED'
-        ticket.save()
+def upload_images_to_cloudinary(staged_images, ticket_id):
+    run_upload_job(staged_images, ticket_id)
@@ -1,14 +1,99 @@
+import asyncio
+import csv
+import gzip
+import hashlib
+import json
+import shutil
+import tempfile
+import threading
+import time
+from datetime import datetime, timedelta, timezone as dt_timezone
+from unittest.mock import patch
+
 from django.contrib.auth.models import User
+from django.core.cache import cache
+from django.core.management import call_command
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.files.uploadhandler import StopUpload
+from django.db import connection
+from django.test import SimpleTestCase, TestCase, override_settings
+from django_rq import get_connection
+from prometheus_client import REGISTRY
+from redis.exceptions import ConnectionError as RedisConnectionError
+from rq import Queue
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
+from django.utils import timezone
+from rest_framework.renderers import JSONRenderer
 from rest_framework.test import APITestCase
 from rest_framework import status
 from rest_framework.authtoken.models import Token
 
-from io import BytesIO
+from io import BytesIO, StringIO
 from PIL import Image as PILImage
 
-from api.serializers import MAX_FILE_SIZE_MB
-from .models import Ticket, Image
+from api.serializers import (
+    FILE_COUNT_ERROR,
+    FILE_FORMAT_ERROR,
+    FILE_SIZE_ERROR,
+    MAX_EMBEDDED_IMAGES,
+    MAX_FILE_SIZE_MB,
+    UPLOAD_SIZE_ERROR,
+    TicketSerializer,
+)
+from .cache import LocalTTLCache, _token_cache_key, set_cached_ticket
+from .events import publish_ticket_event
+from .imaging import optimize_image
+from .models import ArchivedImage, ArchivedTicket, Ticket, TicketStats, Image
+from .staging import (
+    discard_staged_image,
+    get_staging_storage,
+    open_staged_image,
+    stage_image,
+)
+from .metrics import QueueCollector
+from .scheduling import UploadScheduler
+from .throttling import RedisTokenBucket, _load_token_bucket
+from .tasks import (
+    store_staged_images,
+    ticket_completed,
+    upload_image_to_cloudinary,
+    uploader,
+)
+from .upload_handlers import ImageUploadGuardHandler
+from .utils import ImageUploader, InMemoryStrategy
+from .workers import ConcurrentWorker
+
+STAGING_DIR = tempfile.mkdtemp()
+
+
+def staging_storages():
+    return {
+        'default': {'BACKEND': 'django.core.files.storage.FileSystemStorage'},
+        'staticfiles': {
+            'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage'
+        },
+        'staging': {
+            'BACKEND': 'django.core.files.storage.FileSystemStorage',
+            'OPTIONS': {'location': STAGING_DIR},
+        },
+    }
+
+
+# Cached tokens and tickets are keyed by ids that repeat across test runs,
+# so the tests don't use the shared cache
+local_caches = override_settings(
+    CACHES={'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'}}
+)
+
+
+def setUpModule():
+    local_caches.enable()
+
+
+def tearDownModule():
+    local_caches.disable()
+    shutil.rmtree(STAGING_DIR, ignore_errors=True)
 
 
 class UserRegistrationTestCase(APITestCase):
@@ -95,6 +180,99 @@ class TicketListCreateAPIViewTest(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), 2)
 
+    def test_list_matches_serializer_output(self):
+        for title in ['Plain', 'Ünïcode 😀 "quoted" \\ </script>', 'Line\u2028\x1f\t']:
+            Ticket.objects.create(
+                title=title, description='', user=self.user, num_images=1
+            )
+        Ticket.objects.filter(title='Plain').update(
+            created_at=datetime(2024, 1, 2, 3, 4, 5, tzinfo=dt_timezone.utc)
+        )
+        tickets = Ticket.objects.order_by('-id')
+        expected = JSONRenderer().render(
+            {
+                'next': None,
+                'previous': None,
+                'results': TicketSerializer(tickets, many=True).data,
+            }
+        )
+        url = reverse('ticket_list_create')
+        self.assertEqual(self.client.get(url).content, expected)
+        with patch('api.renderers.orjson', None):
+            self.assertEqual(self.client.get(url).content, expected)
+
+    def test_list_sparse_fields(self):
+        Ticket.objects.create(
+            title='Ticket', description='Description', user=self.user, num_images=1
+        )
+        url = reverse('ticket_list_create')
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(url + '?fields=status,id')
+        self.assertEqual(list(response.data['results'][0]), ['id', 'status'])
+        self.assertNotIn('description', queries[-1]['sql'])
+        response = self.client.get(url + '?fields=status,created_at')
+        self.assertEqual(list(response.data['results'][0]), ['status', 'created_at'])
+        response = self.client.get(url + '?fields=status,secret')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_sparse_fields_without_id_across_pages(self):
+        Ticket.objects.bulk_create(
+            Ticket(title=f'Ticket {i}', description='', user=self.user, num_images=1)
+            for i in range(15)
+        )
+        url = reverse('ticket_list_create')
+        response = self.client.get(url + '?fields=title,status')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 10)
+        self.assertEqual(list(response.data['results'][0]), ['title', 'status'])
+        response = self.client.get(response.data['next'])
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(len(response.data['results']), 5)
+        self.assertIsNotNone(response.data['previous'])
+
+    def test_list_include_images(self):
+        for i in range(3):
+            ticket = Ticket.objects.create(
+                title=f'Ticket {i}', description='', user=self.user, num_images=2
+            )
+            for n in range(2):
+                Image.objects.create(
+                    ticket=ticket, cloudinary_url=f'http://example.com/{i}/{n}.png'
+                )
+        url = reverse('ticket_list_create') + '?include=images&fields=id,status'
+        self.client.get(url)
+        # The token is cached: one query for the tickets, one for their images
+        with self.assertNumQueries(2):
+            response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        first = response.data['results'][0]
+        self.assertEqual(list(first), ['id', 'status', 'images', 'images_url'])
+        self.assertEqual(
+            [image['cloudinary_url'] for image in first['images']],
+            ['http://example.com/2/0.png', 'http://example.com/2/1.png'],
+        )
+        self.assertEqual(
+            first['images_url'],
+            'http://testserver'
+            + reverse('ticket_images', kwargs={'ticket_id': first['id']}),
+        )
+        response = self.client.get(reverse('ticket_list_create') + '?include=user')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+    def test_list_include_images_is_capped(self):
+        ticket = Ticket.objects.create(
+            title='Ticket', description='', user=self.user, num_images=1
+        )
+        Image.objects.bulk_create(
+            Image(ticket=ticket, cloudinary_url=f'http://example.com/{n}.png')
+            for n in range(MAX_EMBEDDED_IMAGES + 5)
+        )
+        url = reverse('ticket_list_create') + '?include=images'
+        response = self.client.get(url)
+        images = response.data['results'][0]['images']
+        self.assertEqual(len(images), MAX_EMBEDDED_IMAGES)
+        self.assertEqual(images[0]['cloudinary_url'], 'http://example.com/0.png')
+
     def test_filter_tickets_by_status(self):
         Ticket.objects.create(
             title='Ticket 1', description='Description 1', user=self.user, num_images=1
@@ -129,6 +307,121 @@ class TicketListCreateAPIViewTest(APITestCase):
         self.assertEqual(response.status_code, 200)
         self.assertEqual(len(response.data['results']), 2)
 
+    def test_list_tickets_cursor_pagination(self):
+        tickets = [
+            Ticket.objects.create(
+                title=f'Ticket {i}',
+                description='Description',
+                user=self.user,
+                num_images=1,
+            )
+            for i in range(3)
+        ]
+        url = reverse('ticket_list_create')
+        response = self.client.get(url + '?page_size=2', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn('count', response.data)
+        self.assertEqual(
+            [ticket['id'] for ticket in response.data['results']],
+            [tickets[2].id, tickets[1].id],
+        )
+        response = self.client.get(response.data['next'], format='json')
+        self.assertEqual(
+            [ticket['id'] for ticket in response.data['results']], [tickets[0].id]
+        )
+        self.assertIsNone(response.data['next'])
+
+    def test_list_tickets_page_number_pagination(self):
+        for i in range(3):
+            Ticket.objects.create(
+                title=f'Ticket {i}',
+                description='Description',
+                user=self.user,
+                num_images=1,
+            )
+        url = reverse('ticket_list_create')
+        response = self.client.get(url + '?page=2&page_size=2', format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 3)
+        self.assertEqual(len(response.data['results']), 1)
+
+    def test_filter_tickets_by_created_at_range(self):
+        old_ticket = Ticket.objects.create(
+            title='Old', description='Description', user=self.user, num_images=1
+        )
+        Ticket.objects.filter(pk=old_ticket.pk).update(
+            created_at='2024-01-15T00:00:00Z', updated_at='2024-01-15T00:00:00Z'
+        )
+        Ticket.objects.create(
+            title='New', description='Description', user=self.user, num_images=1
+        )
+        url = reverse('ticket_list_create')
+        response = self.client.get(
+            url + '?created_at__gte=2024-01-01&created_at__lt=2024-02-01'
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual([t['title'] for t in response.data['results']], ['Old'])
+        response = self.client.get(url + '?updated_at__gte=2024-02-01')
+        self.assertEqual([t['title'] for t in response.data['results']], ['New'])
+
+    def test_list_tickets_query_count(self):
+        for i in range(15):
+            Ticket.objects.create(
+                title=f'Ticket {i}',
+                description='Description',
+                user=self.user,
+                num_images=1,
+                status='COMPLETED' if i % 2 else 'CREATED',
+            )
+        url = reverse('ticket_list_create')
+        # Token lookup and a single page query: no COUNT(*)
+        with self.assertNumQueries(2):
+            response = self.client.get(
+                url + '?status=COMPLETED&created_at__gte=2024-01-01'
+            )
+        self.assertEqual(len(response.data['results']), 7)
+
+    def test_search_tickets_ranked(self):
+        other_user = User.objects.create_user(username='other', password='pw')
+        Ticket.objects.create(
+            title='Printer', description='Paper jam', user=self.user, num_images=1
+        )
+        Ticket.objects.create(
+            title='Login broken',
+            description='Password reset fails',
+            user=self.user,
+            num_images=1,
+        )
+        Ticket.objects.create(
+            title='Password manager',
+            description='Needs license',
+            user=self.user,
+            num_images=1,
+        )
+        Ticket.objects.create(
+            title='Password', description='Password', user=other_user, num_images=1
+        )
+        url = reverse('ticket_list_create')
+        response = self.client.get(url + '?q=password')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.data['count'], 2)
+        self.assertEqual(
+            [ticket['title'] for ticket in response.data['results']],
+            ['Password manager', 'Login broken'],
+        )
+
+    def test_search_index_follows_updates(self):
+        ticket = Ticket.objects.create(
+            title='Printer', description='Paper jam', user=self.user, num_images=1
+        )
+        url = reverse('ticket_list_create')
+        ticket.title = 'Scanner'
+        ticket.save()
+        self.assertEqual(self.client.get(url + '?q=printer').data['count'], 0)
+        self.assertEqual(self.client.get(url + '?q=scanner').data['count'], 1)
+        # Query syntax characters are matched as plain words
+        self.assertEqual(self.client.get(url + '?q="scanner*(').data['count'], 1)
+
     def test_create_ticket_missing_fields(self):
         # Test creating a ticket with missing fields
         data = {}
@@ -194,6 +487,176 @@ class TicketListCreateAPIViewTest(APITestCase):
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
 
 
+class TicketExportAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.url = reverse('ticket_export')
+        for i in range(3):
+            Ticket.objects.create(
+                title=f'Ticket, "{i}"',
+                description='Line 1\nLine 2',
+                user=self.user,
+                num_images=1,
+                status='COMPLETED' if i else 'CREATED',
+            )
+        other = User.objects.create_user(username='other', password='pw')
+        Ticket.objects.create(title='Other', description='', user=other, num_images=1)
+
+    def test_export_ndjson(self):
+        response = self.client.get(self.url + '?status=COMPLETED')
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'application/x-ndjson')
+        lines = b''.join(response.streaming_content).splitlines()
+        listed = self.client.get(reverse('ticket_list_create') + '?status=COMPLETED')
+        self.assertEqual([json.loads(line) for line in lines], listed.json()['results'])
+
+    async def test_export_streams_under_asgi(self):
+        response = await self.async_client.get(
+            self.url, headers={'Authorization': f'Bearer {self.token.key}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        # Streamed as it is read, not collected by the handler first
+        self.assertTrue(response.is_async)
+        content = b''.join([chunk async for chunk in response.streaming_content])
+        self.assertEqual(len(content.splitlines()), 3)
+
+    def test_export_csv(self):
+        response = self.client.get(self.url + '?output=csv')
+        self.assertEqual(response['Content-Type'], 'text/csv; charset=utf-8')
+        content = b''.join(response.streaming_content).decode()
+        rows = list(csv.DictReader(content.splitlines(keepends=True)))
+        self.assertEqual(
+            [row['title'] for row in rows],
+            ['Ticket, "2"', 'Ticket, "1"', 'Ticket, "0"'],
+        )
+        self.assertEqual(rows[0]['description'], 'Line 1\nLine 2')
+
+    def test_export_gzip(self):
+        response = self.client.get(self.url, HTTP_ACCEPT_ENCODING='gzip, deflate')
+        self.assertEqual(response['Content-Encoding'], 'gzip')
+        self.assertIn('Accept-Encoding', response['Vary'])
+        content = gzip.decompress(b''.join(response.streaming_content))
+        self.assertEqual(len(content.splitlines()), 3)
+
+    def test_export_unknown_output(self):
+        response = self.client.get(self.url + '?output=xml')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+
+
+class TicketBulkCreateAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.url = reverse('ticket_bulk_create')
+
+    def test_bulk_create_tickets_with_one_insert(self):
+        data = [
+            {'title': f'Ticket {i}', 'description': 'Imported', 'num_images': 1}
+            for i in range(50)
+        ]
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        inserts = [
+            q for q in queries if q['sql'].startswith('INSERT INTO "api_ticket"')
+        ]
+        self.assertEqual(len(inserts), 1)
+        self.assertEqual(Ticket.objects.filter(user=self.user).count(), 50)
+        result = response.data['results'][49]
+        self.assertEqual(result['status'], 201)
+        self.assertEqual(
+            Ticket.objects.get(pk=result['ticket']['id']).title, 'Ticket 49'
+        )
+
+    def test_bulk_create_ndjson_reports_invalid_items(self):
+        body = (
+            '{"title": "First", "description": "Imported", "num_images": 1}\n'
+            '{"title": "Second", "description": "Imported", "num_images": 0}\n'
+            '\n'
+            '{"title": "Third", "description": "Imported", "num_images": 2}\n'
+        )
+        response = self.client.post(self.url, body, content_type='application/x-ndjson')
+        self.assertEqual(response.status_code, status.HTTP_207_MULTI_STATUS)
+        results = response.data['results']
+        self.assertEqual([result['status'] for result in results], [201, 400, 201])
+        self.assertIn('num_images', results[1]['errors'])
+        self.assertEqual(
+            list(Ticket.objects.order_by('id').values_list('title', flat=True)),
+            ['First', 'Third'],
+        )
+
+    def test_bulk_create_rejects_non_list(self):
+        data = {'title': 'Ticket', 'description': 'Imported', 'num_images': 1}
+        response = self.client.post(self.url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Ticket.objects.exists())
+
+
+@override_settings(STORAGES=staging_storages())
+class TicketStatsAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.url = reverse('ticket_stats')
+
+    def create_tickets(self):
+        data = {'title': 'Ticket', 'description': 'Description', 'num_images': 1}
+        self.client.post(reverse('ticket_list_create'), data, format='json')
+        data = [dict(data, num_images=2), dict(data, num_images=3)]
+        self.client.post(reverse('ticket_bulk_create'), data, format='json')
+        ticket = Ticket.objects.get(num_images=1)
+        upload = SimpleUploadedFile('test.gif', b'GIF89a')
+        store_staged_images([stage_image(upload, ticket.id)], ticket.id)
+
+    def test_stats_are_updated_incrementally(self):
+        self.create_tickets()
+        # The token is cached, so only the stats row is read
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(
+            response.data,
+            {
+                'total_tickets': 3,
+                'created_tickets': 2,
+                'completed_tickets': 1,
+                'requested_images': 6,
+                'uploaded_images': 1,
+            },
+        )
+
+    def test_completing_uncounted_ticket(self):
+        self.create_tickets()
+        # Created without going through the API, so not counted as created
+        ticket = Ticket.objects.create(
+            title='Ticket', description='', user=self.user, num_images=1
+        )
+        TicketStats.objects.update(created_tickets=0)
+        upload = SimpleUploadedFile('test.gif', b'GIF89a-uncounted')
+        self.assertTrue(
+            store_staged_images([stage_image(upload, ticket.id)], ticket.id)
+        )
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['created_tickets'], 0)
+        self.assertEqual(response.data['completed_tickets'], 2)
+
+    def test_stats_without_tickets(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['total_tickets'], 0)
+
+    def test_rebuild_command_recounts_stats(self):
+        self.create_tickets()
+        expected = self.client.get(self.url).data
+        TicketStats.objects.update(created_tickets=0, uploaded_images=0)
+        call_command('rebuild_ticket_stats', stdout=StringIO())
+        self.assertEqual(self.client.get(self.url).data, expected)
+
+
+@override_settings(STORAGES=staging_storages())
 class TicketImagesAPIViewTest(APITestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -208,10 +671,10 @@ class TicketImagesAPIViewTest(APITestCase):
             num_images=1,
         )
 
-    def create_image_file(self):
+    def create_image_file(self, color=0):
         # Create a test image file
         file = BytesIO()
-        image = PILImage.new('RGB', (100, 100))
+        image = PILImage.new('RGB', (100, 100), color)
         image.save(file, 'png')
         file.name = 'test.png'
         file.seek(0)
@@ -239,6 +702,109 @@ class TicketImagesAPIViewTest(APITestCase):
         response = self.client.post(url, data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
 
+    def test_upload_oversized_image_with_valid_header(self):
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        content = b'\x89PNG\r\n\x1a\n' + b'0' * (MAX_FILE_SIZE_MB * 1024 * 1024)
+        data = {'image': SimpleUploadedFile('big.png', content)}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'image': [FILE_SIZE_ERROR]})
+
+    def test_upload_image_with_spoofed_extension(self):
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {'image': SimpleUploadedFile('fake.png', b'<html>not an image')}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'image': [FILE_FORMAT_ERROR]})
+
+    def test_upload_image_batch(self):
+        self.ticket.num_images = 3
+        self.ticket.save()
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {'images': [self.create_image_file(i) for i in range(3)]}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Image.objects.filter(ticket=self.ticket).count(), 3)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'COMPLETED')
+
+    def test_upload_same_image_twice(self):
+        self.ticket.num_images = 2
+        self.ticket.save()
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        for _ in range(2):
+            response = self.client.post(
+                url, {'image': self.create_image_file()}, format='multipart'
+            )
+            self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Image.objects.filter(ticket=self.ticket).count(), 2)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'COMPLETED')
+
+    def test_upload_image_batch_reports_invalid_files(self):
+        self.ticket.num_images = 2
+        self.ticket.save()
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {
+            'images': [
+                self.create_image_file(),
+                SimpleUploadedFile('notes.txt', b'\x89PNG\r\n\x1a\nabc'),
+            ]
+        }
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data['images'][1], [FILE_FORMAT_ERROR])
+        self.assertFalse(Image.objects.filter(ticket=self.ticket).exists())
+
+    def test_upload_image_batch_exceeds_num_images(self):
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {'images': [self.create_image_file() for _ in range(2)]}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertFalse(Image.objects.filter(ticket=self.ticket).exists())
+
+    def test_list_images_paginated(self):
+        images = Image.objects.bulk_create(
+            Image(ticket=self.ticket, cloudinary_url=f'http://example.com/{i}.png')
+            for i in range(5)
+        )
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        self.client.get(url)
+        # The token is cached: the ownership check, then the page of images
+        with self.assertNumQueries(2):
+            response = self.client.get(url + '?page_size=3')
+        self.assertEqual(
+            [image['id'] for image in response.data['results']],
+            [image.id for image in images[:3]],
+        )
+        response = self.client.get(response.data['next'])
+        self.assertEqual(
+            [image['id'] for image in response.data['results']],
+            [image.id for image in images[3:]],
+        )
+        self.assertIsNone(response.data['next'])
+
+    def test_list_images_of_another_user(self):
+        other = User.objects.create_user(username='other', password='pw')
+        ticket = Ticket.objects.create(
+            title='Other', description='', user=other, num_images=1
+        )
+        Image.objects.create(ticket=ticket, cloudinary_url='http://example.com/1.png')
+        url = reverse('ticket_images', kwargs={'ticket_id': ticket.id})
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    def test_upload_image_batch_counts_uploaded_images(self):
+        self.ticket.num_images = 2
+        self.ticket.uploaded_images = 1
+        self.ticket.save()
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {'images': [self.create_image_file(i) for i in range(2)]}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_400_BAD_REQUEST)
+        self.assertEqual(response.data, {'error': 'Ticket only accepts 1 more images.'})
+        self.assertFalse(Image.objects.filter(ticket=self.ticket).exists())
+
     def test_upload_image_unauthenticated(self):
         self.client.credentials()  # Remove authentication
         url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
@@ -246,3 +812,821 @@ class TicketImagesAPIViewTest(APITestCase):
         data = {'image': image_file}
         response = self.client.post(url, data, format='multipart')
         self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_upload_image_discards_staged_copy(self):
+        url = reverse('ticket_images', kwargs={'ticket_id': self.ticket.id})
+        data = {'image': self.create_image_file()}
+        response = self.client.post(url, data, format='multipart')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        _, files = get_staging_storage().listdir(f'tickets/{self.ticket.id}')
+        self.assertEqual(files, [])
+
+
+@override_settings(
+    STORAGES=staging_storages(),
+    THROTTLE_BACKEND='api.throttling.InMemoryTokenBucket',
+)
+class ThrottlingTest(APITestCase):
+    def setUp(self):
+        _load_token_bucket.cache_clear()
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+
+    @override_settings(THROTTLE_RATES={'read': '2/min'})
+    def test_reads_are_throttled(self):
+        url = reverse('ticket_list_create')
+        for _ in range(2):
+            self.assertEqual(self.client.get(url).status_code, status.HTTP_200_OK)
+        response = self.client.get(url)
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '30')
+        # Writes have their own budget
+        data = {'title': 'Ticket', 'description': 'Description', 'num_images': 1}
+        response = self.client.post(url, data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+
+    @override_settings(THROTTLE_RATES={'ticket_create': '3/hour'})
+    def test_ticket_creation_spends_a_token_per_ticket(self):
+        data = {'title': 'Ticket', 'description': 'Description', 'num_images': 1}
+        response = self.client.post(
+            reverse('ticket_bulk_create'), [data, data], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        response = self.client.post(
+            reverse('ticket_bulk_create'), [data, data], format='json'
+        )
+        self.assertEqual(response.status_code, status.HTTP_429_TOO_MANY_REQUESTS)
+        self.assertEqual(response['Retry-After'], '1200')
+        response = self.client.post(reverse('ticket_list_create'), data, format='json')
+        self.assertEqual(response.status_code, status.HTTP_201_CREATED)
+        self.assertEqual(Ticket.objects.count(), 3)
+
+    @override_settings(THROTTLE_RATES={'image_upload_bytes': '3000/min'})
+    def test_image_uploads_are_throttled_by_size(self):
+        ticket = Ticket.objects.create(
+            user=self.user, title='Ticket', description='', num_images=2
+        )
+        url = reverse('ticket_images', kwargs={'ticket_id': ticket.id})
+        for color, expected_status in (
+            (0, status.HTTP_201_CREATED),
+            (1, status.HTTP_429_TOO_MANY_REQUESTS),
+        ):
+            content = b'GIF89a' + bytes([color]) * 2000
+            data = {'image': SimpleUploadedFile('image.gif', content)}
+            response = self.client.post(url, data, format='multipart')
+            self.assertEqual(response.status_code, expected_status)
+        self.assertEqual(Image.objects.filter(ticket=ticket).count(), 1)
+
+    def test_redis_token_bucket(self):
+        bucket = RedisTokenBucket()
+        key = 'throttle:test:1'
+        self.addCleanup(bucket.connection.delete, key)
+        self.assertEqual(bucket.consume(key, 2, 2, 0.5), 0)
+        self.assertAlmostEqual(bucket.consume(key, 1, 2, 0.5), 2, delta=0.1)
+
+    def test_redis_token_bucket_fails_open(self):
+        bucket = RedisTokenBucket()
+        error = RedisConnectionError('Connection refused')
+        with patch.object(bucket, 'script', side_effect=error):
+            with self.assertLogs('api.throttling', 'WARNING'):
+                self.assertEqual(bucket.consume('throttle:test:1', 1, 2, 0.5), 0)
+
+
+class ImageUploadGuardHandlerTest(TestCase):
+    def start_file(self, handler):
+        handler.new_file('image', 'test.png', 'image/png', None)
+
+    def test_rejects_bad_magic_bytes_on_first_chunk(self):
+        handler = ImageUploadGuardHandler()
+        self.start_file(handler)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'%PDF-1.7 not an image', 0)
+        self.assertEqual(handler.errors, {'image': [FILE_FORMAT_ERROR]})
+
+    def test_rejects_as_soon_as_limit_is_exceeded(self):
+        handler = ImageUploadGuardHandler()
+        handler.max_size = 100
+        self.start_file(handler)
+        chunk = handler.receive_data_chunk(b'GIF89a' + b'0' * 58, 0)
+        self.assertEqual(len(chunk), 64)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'0' * 64, 64)
+        self.assertEqual(handler.errors, {'image': [FILE_SIZE_ERROR]})
+
+    def test_rejects_too_many_files(self):
+        handler = ImageUploadGuardHandler()
+        handler.max_files = 2
+        for _ in range(2):
+            self.start_file(handler)
+        with self.assertRaises(StopUpload):
+            self.start_file(handler)
+        self.assertEqual(handler.errors, {'image': [FILE_COUNT_ERROR]})
+
+    def test_rejects_files_exceeding_total_size(self):
+        handler = ImageUploadGuardHandler()
+        handler.max_total_size = 100
+        self.start_file(handler)
+        handler.receive_data_chunk(b'GIF89a' + b'0' * 58, 0)
+        self.start_file(handler)
+        with self.assertRaises(StopUpload):
+            handler.receive_data_chunk(b'GIF89a' + b'0' * 58, 0)
+        self.assertEqual(handler.errors, {'image': [UPLOAD_SIZE_ERROR]})
+
+    def test_signature_split_across_chunks(self):
+        handler = ImageUploadGuardHandler()
+        self.start_file(handler)
+        handler.receive_data_chunk(b'\x89PN', 0)
+        handler.receive_data_chunk(b'G\r\n\x1a\n0000', 4)
+        handler.file_complete(14)
+        self.assertEqual(handler.errors, {})
+
+
+@override_settings(STORAGES=staging_storages())
+class StagingTest(TestCase):
+    def test_stage_image_returns_reference(self):
+        content = b'\x89PNG\r\n\x1a\n' + b'0' * 200_000
+        upload = SimpleUploadedFile('test.png', content, content_type='image/png')
+        staged_image = stage_image(upload, ticket_id=1)
+        self.assertEqual(staged_image['size'], len(content))
+        self.assertEqual(staged_image['sha256'], hashlib.sha256(content).hexdigest())
+        with open_staged_image(staged_image) as image_file:
+            self.assertEqual(image_file.read(), content)
+        discard_staged_image(staged_image)
+        self.assertFalse(get_staging_storage().exists(staged_image['key']))
+
+
+@override_settings(STORAGES=staging_storages())
+class StoreStagedImagesTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.ticket = Ticket.objects.create(
+            title='Test Ticket',
+            description='Test Description',
+            user=self.user,
+            num_images=3,
+        )
+
+    def stage(self, count, start=0, ticket=None):
+        ticket_id = (ticket or self.ticket).id
+        return [
+            stage_image(
+                SimpleUploadedFile('test.gif', b'GIF89a' + bytes([i])), ticket_id
+            )
+            for i in range(start, start + count)
+        ]
+
+    def test_counts_uploads_without_counting_rows(self):
+        with CaptureQueriesContext(connection) as queries:
+            completed = store_staged_images(self.stage(2), self.ticket.id)
+        self.assertFalse(completed)
+        self.assertFalse(any('COUNT(' in q['sql'].upper() for q in queries))
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.uploaded_images, 2)
+        self.assertEqual(self.ticket.status, 'CREATED')
+
+    @override_settings(
+        IMAGE_OPTIMIZATION_ENABLED=True,
+        IMAGE_OPTIMIZATION_MAX_DIMENSION=256,
+        IMAGE_OPTIMIZATION_QUALITY=70,
+    )
+    def test_records_optimized_sizes(self):
+        file = BytesIO()
+        PILImage.effect_noise((1024, 768), 64).convert('RGB').save(
+            file, 'JPEG', quality=95
+        )
+        original = file.getvalue()
+        upload = SimpleUploadedFile('photo.jpg', original)
+        store_staged_images([stage_image(upload, self.ticket.id)], self.ticket.id)
+        image = Image.objects.get(ticket=self.ticket)
+        self.assertEqual(image.original_size, len(original))
+        self.assertLess(image.uploaded_size, image.original_size)
+
+    def test_completes_ticket_exactly_once(self):
+        self.assertTrue(store_staged_images(self.stage(3), self.ticket.id))
+        self.assertFalse(store_staged_images(self.stage(1, start=3), self.ticket.id))
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.status, 'COMPLETED')
+        self.assertEqual(self.ticket.uploaded_images, 4)
+
+    def test_reuses_url_of_known_content(self):
+        other = Ticket.objects.create(title='Other', user=self.user, num_images=1)
+        store_staged_images(self.stage(1, ticket=other), other.id)
+        with patch.object(uploader, 'upload_image') as upload_image:
+            store_staged_images(self.stage(1), self.ticket.id)
+        upload_image.assert_not_called()
+        original, reused = Image.objects.order_by('id')
+        self.assertEqual(reused.ticket_id, self.ticket.id)
+        self.assertEqual(reused.cloudinary_url, original.cloudinary_url)
+        self.assertEqual(reused.uploaded_size, 0)
+
+    def test_retried_upload_is_not_stored_twice(self):
+        staged_images = self.stage(2)
+        store_staged_images(staged_images, self.ticket.id)
+        store_staged_images(staged_images, self.ticket.id)
+        self.assertEqual(Image.objects.filter(ticket=self.ticket).count(), 2)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.uploaded_images, 2)
+        self.assertEqual(self.ticket.status, 'CREATED')
+
+    def test_identical_files_are_all_counted(self):
+        staged_images = self.stage(1) + self.stage(1) + self.stage(1)
+        with patch.object(uploader, 'upload_image', return_value='http://x/1.gif'):
+            self.assertTrue(store_staged_images(staged_images, self.ticket.id))
+            self.assertEqual(uploader.upload_image.call_count, 1)
+        self.ticket.refresh_from_db()
+        self.assertEqual(self.ticket.uploaded_images, 3)
+        images = Image.objects.filter(ticket=self.ticket).order_by('id')
+        self.assertEqual([image.uploaded_size for image in images], [7, 0, 0])
+
+
+class RequestMetricsMiddlewareTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.labels = {'view': 'ticket_list_create', 'method': 'GET'}
+
+    def sample(self, name):
+        return REGISTRY.get_sample_value(name, self.labels) or 0
+
+    def test_records_request_metrics(self):
+        requests = self.sample('api_request_duration_seconds_count')
+        queries = self.sample('api_request_db_queries_sum')
+        size = self.sample('api_response_size_bytes_sum')
+        response = self.client.get(reverse('ticket_list_create'))
+        self.assertEqual(
+            self.sample('api_request_duration_seconds_count'), requests + 1
+        )
+        self.assertEqual(self.sample('api_request_db_queries_sum'), queries + 2)
+        self.assertEqual(
+            self.sample('api_response_size_bytes_sum'), size + len(response.content)
+        )
+        metrics = self.client.get(reverse('metrics'))
+        self.assertEqual(metrics.status_code, 200)
+        self.assertIn(
+            b'api_request_duration_seconds_bucket{le="0.005",method="GET",'
+            b'view="ticket_list_create"}',
+            metrics.content,
+        )
+
+    async def test_records_async_requests(self):
+        requests = self.sample('api_request_duration_seconds_count')
+        queries = self.sample('api_request_db_queries_sum')
+        response = await self.async_client.get(
+            reverse('ticket_list_create'),
+            headers={'authorization': f'Bearer {self.token.key}'},
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            self.sample('api_request_duration_seconds_count'), requests + 1
+        )
+        self.assertEqual(self.sample('api_request_db_queries_sum'), queries + 2)
+
+    @override_settings(REQUEST_METRICS_SLOW_THRESHOLD=0)
+    def test_logs_sql_of_slow_requests(self):
+        with self.assertLogs('api.middleware', 'WARNING') as logs:
+            self.client.get(reverse('ticket_list_create'))
+        self.assertIn('ticket_list_create', logs.output[0])
+        self.assertIn('FROM "api_ticket"', logs.output[0])
+
+
+@override_settings(STORAGES=staging_storages())
+class UploadJobMetricsTest(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.ticket = Ticket.objects.create(
+            title='Test Ticket', description='', user=self.user, num_images=1
+        )
+
+    def sample(self, name, **labels):
+        return REGISTRY.get_sample_value(name, labels) or 0
+
+    def test_records_stage_timings(self):
+        stages = ['queue_wait', 'preprocess', 'upload', 'db_write', 'completion_check']
+        counts = [
+            self.sample('upload_job_stage_seconds_count', stage=stage)
+            for stage in stages
+        ]
+        succeeded = self.sample('upload_jobs_total', outcome='succeeded')
+        upload = SimpleUploadedFile('test.gif', b'GIF89a')
+        upload_image_to_cloudinary.delay(
+            stage_image(upload, self.ticket.id), self.ticket.id
+        )
+        for stage, count in zip(stages, counts):
+            self.assertEqual(
+                self.sample('upload_job_stage_seconds_count', stage=stage), count + 1
+            )
+        self.assertEqual(
+            self.sample('upload_jobs_total', outcome='succeeded'), succeeded + 1
+        )
+
+    def test_reports_queue_depth_and_worker_slots(self):
+        queue = Queue('default', connection=get_connection('default'))
+        queue.enqueue('api.tasks.ticket_completed', self.ticket.id)
+        worker = ConcurrentWorker([queue], connection=queue.connection, concurrency=4)
+        worker.register_birth()
+        self.addCleanup(queue.empty)
+        self.addCleanup(worker.register_death)
+        metrics = {
+            metric.name: metric.samples[0].value
+            for metric in QueueCollector().collect()
+        }
+        self.assertEqual(metrics['rq_queue_jobs'], 1)
+        self.assertEqual(metrics['rq_workers'], 1)
+        self.assertEqual(metrics['rq_worker_slots'], 4)
+        self.assertEqual(metrics['rq_worker_busy_slots'], 0)
+
+
+class UploadSchedulerTest(TestCase):
+    def setUp(self):
+        self.queue = Queue('scheduler-test', connection=get_connection('default'))
+        self.addCleanup(self.queue.empty)
+        self.addCleanup(
+            lambda: self.queue.connection.delete(
+                *self.queue.connection.keys('uploads:*')
+            )
+        )
+        self.users = [
+            User.objects.create_user(username=f'user{i}', password='pw')
+            for i in range(2)
+        ]
+
+    def submit(self, scheduler, user, count=1, num_images=10):
+        ticket = Ticket.objects.create(
+            title='Ticket', description='', user=user, num_images=num_images
+        )
+        for _ in range(count):
+            scheduler.submit(ticket, [{'key': 'k', 'size': 10**7, 'sha256': ''}])
+        return ticket.id
+
+    def finish_all(self, scheduler):
+        released = []
+        while len(self.queue):
+            job = self.queue.dequeue_any([self.queue], None, self.queue.connection)[0]
+            released.append(job.args[1])
+            scheduler.job_finished(job.id)
+        return released
+
+    def test_users_take_turns(self):
+        scheduler = UploadScheduler(self.queue, max_in_flight=1)
+        first = self.submit(scheduler, self.users[0], count=3)
+        second = self.submit(scheduler, self.users[1])
+        self.assertEqual(self.finish_all(scheduler), [first, second, first, first])
+
+    def test_weighted_users_get_more_turns(self):
+        scheduler = UploadScheduler(self.queue)
+        # Queue everything before releasing one job at a time
+        scheduler.max_in_flight = 0
+        ticket = Ticket.objects.create(
+            title='Ticket', description='', user=self.users[0], num_images=10
+        )
+        for _ in range(4):
+            scheduler.submit(
+                ticket, [{'key': 'k', 'size': 10**7, 'sha256': ''}], weight=2
+            )
+        other = self.submit(scheduler, self.users[1], count=2)
+        scheduler.max_in_flight = 1
+        scheduler.dispatch()
+        self.assertEqual(
+            self.finish_all(scheduler),
+            [ticket.id, other, ticket.id, ticket.id, other, ticket.id],
+        )
+
+    def test_lanes_are_visited_by_weight(self):
+        scheduler = UploadScheduler(
+            self.queue, lanes={'high': 3, 'default': 1}, max_in_flight=1
+        )
+        blocker = self.submit(scheduler, self.users[0])
+        # Images that complete their ticket use the high lane
+        high = [self.submit(scheduler, self.users[0], num_images=1) for _ in range(3)]
+        default = [self.submit(scheduler, self.users[1]) for _ in range(3)]
+        released = self.finish_all(scheduler)
+        self.assertEqual(released[0], blocker)
+        self.assertEqual(len(set(released[1:5]) & set(high)), 3)
+        self.assertEqual(released[5:], default[1:])
+
+    def test_caps_jobs_in_flight_per_user(self):
+        scheduler = UploadScheduler(
+            self.queue, max_in_flight=10, max_in_flight_per_user=2
+        )
+        first = self.submit(scheduler, self.users[0], count=4)
+        second = self.submit(scheduler, self.users[1])
+        self.assertEqual(
+            sorted(job.args[1] for job in self.queue.jobs), [first, first, second]
+        )
+
+    def test_records_time_waiting_in_scheduler(self):
+        labels = {'stage': 'scheduler_wait'}
+        sample = 'upload_job_stage_seconds_count'
+        before = REGISTRY.get_sample_value(sample, labels) or 0
+        scheduler = UploadScheduler(self.queue, max_in_flight=1)
+        self.submit(scheduler, self.users[0], count=2)
+        self.assertEqual(REGISTRY.get_sample_value(sample, labels), before + 1)
+        self.finish_all(scheduler)
+        self.assertEqual(REGISTRY.get_sample_value(sample, labels), before + 2)
+
+    def test_expired_slots_are_released(self):
+        scheduler = UploadScheduler(self.queue, max_in_flight=1, lease=0.01)
+        self.submit(scheduler, self.users[0], count=2)
+        self.assertEqual(len(self.queue), 1)
+        time.sleep(0.02)
+        scheduler.dispatch()
+        self.assertEqual(len(self.queue), 2)
+
+    def test_failed_enqueue_is_recovered(self):
+        scheduler = UploadScheduler(self.queue, max_in_flight=2)
+        enqueue_call = self.queue.enqueue_call
+        calls = []
+
+        def fail_first(*args, **kwargs):
+            calls.append(kwargs['job_id'])
+            if len(calls) == 1:
+                raise RedisConnectionError
+            return enqueue_call(*args, **kwargs)
+
+        scheduler.max_in_flight = 0
+        first = self.submit(scheduler, self.users[0])
+        second = self.submit(scheduler, self.users[1])
+        scheduler.max_in_flight = 2
+        with patch.object(self.queue, 'enqueue_call', side_effect=fail_first):
+            with self.assertLogs('api.scheduling', 'ERROR'):
+                scheduler.dispatch()
+        # The later job is still enqueued, the failed one keeps its slot
+        self.assertEqual(len(calls), 2)
+        self.assertEqual(len(self.queue), 1)
+        scheduler.recover()
+        self.assertEqual(len(self.queue), 1)
+        scheduler.recover_after = 0
+        scheduler.recover()
+        self.assertEqual(len(self.queue), 2)
+        self.assertCountEqual(self.finish_all(scheduler), [first, second])
+        self.assertFalse(
+            self.queue.connection.exists(
+                'uploads:in_flight', 'uploads:in_flight:payloads'
+            )
+        )
+
+
+class ArchiveTicketsTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.old = []
+        for i in range(3):
+            ticket = Ticket.objects.create(
+                title=f'Old printer {i}',
+                description='',
+                user=self.user,
+                num_images=1,
+                uploaded_images=1,
+                status='COMPLETED',
+            )
+            Image.objects.create(
+                ticket=ticket, cloudinary_url=f'http://example.com/{i}.png'
+            )
+            self.old.append(ticket)
+        self.recent = Ticket.objects.create(
+            title='Recent', description='', user=self.user, num_images=1
+        )
+        Ticket.objects.update(updated_at=timezone.now() - timedelta(days=100))
+        self.recent.status = 'COMPLETED'
+        self.recent.save()
+
+    def archive(self):
+        call_command('archive_tickets', days=90, batch_size=2, stdout=StringIO())
+
+    def test_archive_moves_old_completed_tickets(self):
+        self.archive()
+        self.assertEqual(
+            list(Ticket.objects.values_list('id', flat=True)), [self.recent.id]
+        )
+        self.assertEqual(
+            sorted(ArchivedTicket.objects.values_list('id', flat=True)),
+            [ticket.id for ticket in self.old],
+        )
+        self.assertEqual(
+            ArchivedImage.objects.filter(ticket=self.old[0].id).get().cloudinary_url,
+            'http://example.com/0.png',
+        )
+        self.assertFalse(Image.objects.exists())
+
+    def test_views_read_the_archive_on_request(self):
+        list_url = reverse('ticket_list_create')
+        detail_url = reverse('ticket_detail', kwargs={'ticket_id': self.old[0].id})
+        expected = self.client.get(detail_url).data
+        self.archive()
+        response = self.client.get(list_url)
+        self.assertEqual(
+            [ticket['id'] for ticket in response.data['results']], [self.recent.id]
+        )
+        response = self.client.get(list_url + '?archived=true&include=images')
+        self.assertEqual(
+            [ticket['id'] for ticket in response.data['results']],
+            [ticket.id for ticket in reversed(self.old)],
+        )
+        self.assertEqual(len(response.data['results'][0]['images']), 1)
+        response = self.client.get(response.data['results'][0]['images_url'])
+        self.assertEqual(
+            [image['cloudinary_url'] for image in response.data['results']],
+            ['http://example.com/2.png'],
+        )
+        response = self.client.get(list_url + '?archived=true&q=printer 1')
+        self.assertEqual(
+            [ticket['id'] for ticket in response.data['results']], [self.old[1].id]
+        )
+        response = self.client.get(detail_url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+        response = self.client.get(detail_url + '?archived=true')
+        self.assertEqual(response.data, expected)
+
+    def test_stats_include_archived_tickets(self):
+        call_command('rebuild_ticket_stats', stdout=StringIO())
+        expected = self.client.get(reverse('ticket_stats')).data
+        self.archive()
+        call_command('rebuild_ticket_stats', stdout=StringIO())
+        self.assertEqual(self.client.get(reverse('ticket_stats')).data, expected)
+
+
+class CachedBearerTokenAuthenticationTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.url = reverse('ticket_list_create')
+
+    def test_cached_token_skips_database_lookup(self):
+        with self.assertNumQueries(2):
+            self.client.get(self.url)
+        with self.assertNumQueries(1):
+            response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_cached_user_has_no_password(self):
+        self.client.get(self.url)
+        cached_user = cache.get(_token_cache_key(self.token.key))
+        self.assertEqual(cached_user, {'pk': self.user.pk, 'is_active': True})
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+
+    def test_deleted_token_is_rejected(self):
+        self.client.get(self.url)
+        self.token.delete()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    def test_deactivated_user_is_rejected(self):
+        self.client.get(self.url)
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+
+class LocalTTLCacheTest(TestCase):
+    def test_evicts_least_recently_used(self):
+        local_cache = LocalTTLCache(maxsize=2, ttl=60)
+        local_cache.set('a', 1)
+        local_cache.set('b', 2)
+        local_cache.get('a')
+        local_cache.set('c', 3)
+        self.assertEqual(local_cache.get('a'), 1)
+        self.assertIsNone(local_cache.get('b'))
+
+    def test_expires_entries(self):
+        local_cache = LocalTTLCache(maxsize=2, ttl=-1)
+        local_cache.set('a', 1)
+        self.assertIsNone(local_cache.get('a'))
+
+
+@override_settings(STORAGES=staging_storages())
+class TicketDetailAPIViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {self.token.key}')
+        self.ticket = Ticket.objects.create(
+            title='Test Ticket',
+            description='Test Description',
+            user=self.user,
+            num_images=1,
+        )
+        self.url = reverse('ticket_detail', kwargs={'ticket_id': self.ticket.id})
+
+    def test_repeated_polls_skip_database(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['title'], 'Test Ticket')
+        with self.assertNumQueries(0):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'CREATED')
+
+    def test_not_modified_with_etag(self):
+        etag = self.client.get(self.url)['ETag']
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+        self.assertEqual(response['ETag'], etag)
+
+    def test_not_modified_with_last_modified(self):
+        last_modified = self.client.get(self.url)['Last-Modified']
+        response = self.client.get(self.url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, status.HTTP_304_NOT_MODIFIED)
+
+    @override_settings(TICKET_EVENTS_BROKER='api.events.InMemoryEventBroker')
+    def test_completion_invalidates_cached_ticket(self):
+        etag = self.client.get(self.url)['ETag']
+        image = SimpleUploadedFile('test.gif', b'GIF89a-image')
+        with self.captureOnCommitCallbacks(execute=True):
+            store_staged_images([stage_image(image, self.ticket.id)], self.ticket.id)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response.data['status'], 'COMPLETED')
+
+    def test_ticket_changed_while_filling_is_not_cached(self):
+        fill = set_cached_ticket
+
+        def complete_then_fill(ticket, data, version):
+            # The worker completes the ticket after the request read it
+            Ticket.objects.filter(pk=ticket.pk).update(status='COMPLETED')
+            ticket_completed(ticket.pk)
+            return fill(ticket, data, version)
+
+        with patch('api.views.set_cached_ticket', complete_then_fill):
+            response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'CREATED')
+        response = self.client.get(self.url)
+        self.assertEqual(response.data['status'], 'COMPLETED')
+
+    def test_cached_ticket_is_not_served_to_other_users(self):
+        self.client.get(self.url)
+        other_user = User.objects.create_user(username='other', password='pw')
+        other_token = Token.objects.create(user=other_user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Bearer {other_token.key}')
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+
+@override_settings(
+    TICKET_EVENTS_BROKER='api.events.InMemoryEventBroker', TICKET_EVENTS_HEARTBEAT=0.05
+)
+class TicketEventsViewTest(APITestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username='testuser', password='pw')
+        self.token = Token.objects.create(user=self.user)
+        self.auth = {'headers': {'Authorization': f'Bearer {self.token.key}'}}
+        self.ticket = Ticket.objects.create(
+            title='Test Ticket',
+            description='Test Description',
+            user=self.user,
+            num_images=1,
+        )
+        self.url = reverse('ticket_events', kwargs={'ticket_id': self.ticket.id})
+        other_user = User.objects.create_user(username='other', password='pw')
+        self.other_token = Token.objects.create(user=other_user)
+
+    async def read_events(self, response, chunks):
+        async for chunk in response.streaming_content:
+            chunks.append(chunk.decode())
+
+    async def wait_for_chunk(self, chunks, text):
+        for _ in range(100):
+            if any(text in chunk for chunk in chunks):
+                return
+            await asyncio.sleep(0.01)
+        self.fail(f'{text!r} not received')
+
+    async def test_completed_ticket_streams_final_state(self):
+        await Ticket.objects.filter(pk=self.ticket.pk).aupdate(status='COMPLETED')
+        response = await self.async_client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_200_OK)
+        self.assertEqual(response['Content-Type'], 'text/event-stream')
+        chunks = [chunk.decode() async for chunk in response.streaming_content]
+        self.assertEqual(
+            chunks,
+            [
+                f'event: ticket\ndata: {{"id": {self.ticket.id}, "status": "COMPLETED"}}\n\n'
+            ],
+        )
+
+    async def test_published_completion_is_pushed(self):
+        response = await self.async_client.get(self.url, **self.auth)
+        chunks = []
+        reader = asyncio.ensure_future(self.read_events(response, chunks))
+        await self.wait_for_chunk(chunks, ': keep-alive')
+        # Published from another thread, as a worker process would
+        await asyncio.to_thread(
+            publish_ticket_event, self.ticket.id, self.user.id, 'COMPLETED'
+        )
+        # The stream ends once the ticket is completed
+        await asyncio.wait_for(reader, 1)
+        self.assertIn('"status": "CREATED"', chunks[0])
+        self.assertIn('"status": "COMPLETED"', chunks[-1])
+
+    def test_not_served_under_wsgi(self):
+        response = self.client.get(self.url, **self.auth)
+        self.assertEqual(response.status_code, status.HTTP_501_NOT_IMPLEMENTED)
+
+    async def test_unauthenticated(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, status.HTTP_401_UNAUTHORIZED)
+
+    async def test_other_users_ticket(self):
+        response = await self.async_client.get(
+            self.url, headers={'Authorization': f'Bearer {self.other_token.key}'}
+        )
+        self.assertEqual(response.status_code, status.HTTP_404_NOT_FOUND)
+
+    async def test_user_events(self):
+        url = reverse('user_ticket_events')
+        response = await self.async_client.get(url, **self.auth)
+        chunks = []
+        reader = asyncio.ensure_future(self.read_events(response, chunks))
+        await self.wait_for_chunk(chunks, ': keep-alive')
+        publish_ticket_event(self.ticket.id, self.user.id, 'COMPLETED')
+        await self.wait_for_chunk(chunks, '"status": "COMPLETED"')
+        # Disconnecting cancels the stream
+        reader.cancel()
+        with self.assertRaises(asyncio.CancelledError):
+            await reader
+
+
+class BarrierStrategy(InMemoryStrategy):
+    """Uploads only once ``parties`` uploads are in flight at the same time."""
+
+    def __init__(self, parties):
+        super().__init__()
+        self.barrier = threading.Barrier(parties, timeout=5)
+
+    def upload_image(self, image_file, **kwargs):
+        self.barrier.wait()
+        return super().upload_image(image_file, **kwargs)
+
+
+class ImageUploaderTest(SimpleTestCase):
+    def test_upload_images_concurrently_in_order(self):
+        strategy = BarrierStrategy(parties=8)
+        uploader = ImageUploader(strategy, max_concurrency=8)
+        image_files = [BytesIO(bytes([i])) for i in range(8)]
+        urls = uploader.upload_images(image_files)
+        self.assertEqual(
+            [strategy.images[url] for url in urls], [bytes([i]) for i in range(8)]
+        )
+
+
+job_barrier = threading.Barrier(4, timeout=5)
+
+
+def wait_for_other_jobs():
+    job_barrier.wait()
+
+
+class ConcurrentWorkerTest(SimpleTestCase):
+    def test_runs_jobs_concurrently(self):
+        queue = Queue('concurrent-worker-test', connection=get_connection('default'))
+        self.addCleanup(queue.delete)
+        # Each job waits until all four are running
+        jobs = [queue.enqueue(wait_for_other_jobs) for _ in range(4)]
+        worker = ConcurrentWorker([queue], connection=queue.connection, concurrency=4)
+        worker.work(burst=True, logging_level='WARNING')
+        self.assertTrue(all(job.get_status(refresh=True) == 'finished' for job in jobs))
+        self.assertEqual(worker.running_jobs, 0)
+        self.assertIsNone(worker.get_current_job_id())
+
+
+class OptimizeImageTest(SimpleTestCase):
+    def encode(self, image, image_format, **kwargs):
+        file = BytesIO()
+        image.save(file, image_format, **kwargs)
+        return file.getvalue()
+
+    def test_caps_dimensions_and_strips_metadata(self):
+        image = PILImage.effect_noise((1200, 600), 64).convert('RGB')
+        exif = PILImage.Exif()
+        exif[0x0110] = 'Test Camera'  # Model
+        data = self.encode(image, 'JPEG', quality=95, exif=exif)
+        optimized = optimize_image(data, max_dimension=300, quality=80)
+        self.assertLess(len(optimized), len(data))
+        with PILImage.open(BytesIO(optimized)) as result:
+            self.assertEqual(result.size, (300, 150))
+            self.assertEqual(len(result.getexif()), 0)
+
+    def test_applies_exif_orientation(self):
+        image = PILImage.effect_noise((400, 200), 64).convert('RGB')
+        exif = PILImage.Exif()
+        exif[0x0112] = 6  # Orientation: rotate 90 degrees
+        data = self.encode(image, 'JPEG', quality=95, exif=exif)
+        optimized = optimize_image(data, max_dimension=100, quality=80)
+        with PILImage.open(BytesIO(optimized)) as result:
+            self.assertEqual(result.size, (50, 100))
+
+    def test_keeps_undecodable_images_unchanged(self):
+        data = self.encode(PILImage.effect_noise((400, 200), 64), 'PNG')
+        for broken in (data[: len(data) // 2], data[:16] + b'\x1f' * 64):
+            with self.assertLogs('api.imaging', 'WARNING'):
+                optimized = optimize_image(broken, max_dimension=100, quality=80)
+            self.assertEqual(optimized, broken)
+
+    def test_keeps_gifs_unchanged(self):
+        data = self.encode(PILImage.new('P', (500, 500)), 'GIF')
+        self.assertEqual(optimize_image(data, max_dimension=100, quality=80), data)
@@ -0,0 +1,163 @@
+import logging
+import threading
+import time
+from functools import lru_cache
+
+import redis
+from django.conf import settings
+from django.utils.module_loading import import_string
+from rest_framework.permissions import SAFE_METHODS
+from rest_framework.throttling import BaseThrottle
+
+from .metrics import THROTTLE_ERRORS
+
+logger = logging.getLogger(__name__)
+
+PERIODS = {'s': 1, 'm': 60, 'h': 3600, 'd': 86400}
+
+# Refills the bucket for the time elapsed since it was last updated, then
+# takes the cost from it if there are enough tokens. Returns the seconds to
+# wait until there are, as a string since Redis truncates Lua numbers.
+TOKEN_BUCKET_SCRIPT = """
+local capacity = tonumber(ARGV[1])
+local rate = tonumber(ARGV[2])
+local cost = tonumber(ARGV[3])
+local time = redis.call('TIME')
+local now = tonumber(time[1]) + tonumber(time[2]) / 1000000
+local bucket = redis.call('HMGET', KEYS[1], 'tokens', 'updated_at')
+local tokens = tonumber(bucket[1]) or capacity
+local updated_at = tonumber(bucket[2]) or now
+tokens = math.min(capacity, tokens + math.max(0, now - updated_at) * rate)
+if tokens < cost then
+    return tostring((cost - tokens) / rate)
+end
+tokens = tokens - cost
+redis.call('HSET', KEYS[1], 'tokens', tostring(tokens), 'updated_at', tostring(now))
+-- A full bucket is the same as a missing one
+redis.call('EXPIRE', KEYS[1], math.max(1, math.ceil((capacity - tokens) / rate)))
+return '0'
+"""
+
+
+class RedisTokenBucket:
+    """Token buckets shared by all processes, updated atomically in Redis."""
+
+    def __init__(self, url=None):
+        self.connection = redis.Redis.from_url(url or settings.THROTTLE_REDIS_URL)
+        self.script = self.connection.register_script(TOKEN_BUCKET_SCRIPT)
+
+    def consume(self, key, cost, capacity, rate):
+        try:
+            return float(self.script(keys=[key], args=[capacity, rate, cost]))
+        except redis.RedisError:
+            # Fail open: an outage lets requests through rather than failing them
+            logger.warning('Throttle check failed, request allowed', exc_info=True)
+            THROTTLE_ERRORS.inc()
+            return 0.0
+
+
+class InMemoryTokenBucket:
+    """Token buckets kept in the process, for a single process and tests."""
+
+    def __init__(self):
+        self._buckets = {}
+        self._lock = threading.Lock()
+
+    def consume(self, key, cost, capacity, rate):
+        now = time.monotonic()
+        with self._lock:
+            tokens, updated_at = self._buckets.get(key, (capacity, now))
+            tokens = min(capacity, tokens + (now - updated_at) * rate)
+            if tokens < cost:
+                return (cost - tokens) / rate
+            self._buckets[key] = (tokens - cost, now)
+            return 0.0
+
+
+@lru_cache
+def _load_token_bucket(path):
+    return import_string(path)()
+
+
+def get_token_bucket():
+    return _load_token_bucket(settings.THROTTLE_BACKEND)
+
+
+def parse_rate(rate):
+    """Return the tokens and seconds of a rate like '100/min'."""
+    tokens, period = rate.split('/')
+    return int(tokens), PERIODS[period[0]]
+
+
+class TokenBucketThrottle(BaseThrottle):
+    """
+    Throttles users with a token bucket per scope, refilled at the rate set
+    in ``THROTTLE_RATES[scope]`` and holding up to a period's worth of
+    tokens. Requests the throttle applies to spend ``get_cost()`` tokens.
+    """
+
+    scope = None
+
+    def __init__(self):
+        rate = settings.THROTTLE_RATES.get(self.scope)
+        self.capacity, period = parse_rate(rate) if rate else (None, None)
+        if rate:
+            self.rate = self.capacity / period
+        self.duration = None
+
+    def applies_to(self, request, view):
+        return True
+
+    def get_cost(self, request, view):
+        return 1
+
+    def allow_request(self, request, view):
+        if (
+            self.capacity is None
+            or not request.user.is_authenticated
+            or not self.applies_to(request, view)
+        ):
+            return True
+        # Requests costing more than the bucket holds need it to be full
+        cost = min(self.get_cost(request, view), self.capacity)
+        key = f'throttle:{self.scope}:{request.user.pk}'
+        self.duration = get_token_bucket().consume(key, cost, self.capacity, self.rate)
+        return self.duration == 0
+
+    def wait(self):
+        return self.duration
+
+
+class TicketCreateThrottle(TokenBucketThrottle):
+    """Spends a token per ticket created, including each one of a bulk request."""
+
+    scope = 'ticket_create'
+
+    def applies_to(self, request, view):
+        return request.method == 'POST'
+
+    def get_cost(self, request, view):
+        data = request.data
+        return len(data) if isinstance(data, list) else 1
+
+
+class ImageUploadBytesThrottle(TokenBucketThrottle):
+    """Spends a token per byte uploaded, as declared before the body is read."""
+
+    scope = 'image_upload_bytes'
+
+    def applies_to(self, request, view):
+        return request.method == 'POST'
+
+    def get_cost(self, request, view):
+        try:
+            return int(request.META.get('CONTENT_LENGTH') or 0)
+        except ValueError:
+            return 0
+
+
+class ReadThrottle(TokenBucketThrottle):
+    scope = 'read'
+
+    def applies_to(self, request, view):
+        return request.method in SAFE_METHODS
@@ -0,0 +1,72 @@
+from django.core.files.uploadhandler import FileUploadHandler, StopUpload
+
+from .serializers import (
+    FILE_COUNT_ERROR,
+    FILE_FORMAT_ERROR,
+    FILE_SIZE_ERROR,
+    MAX_FILE_SIZE_BYTES,
+    MAX_IMAGES_PER_REQUEST,
+    MAX_UPLOAD_SIZE_BYTES,
+    UPLOAD_SIZE_ERROR,
+)
+from .utils import IMAGE_SIGNATURE_LENGTH, sniff_image_format
+
+
+class ImageUploadGuardHandler(FileUploadHandler):
+    """
+    Upload handler that validates image files while they are being received.
+
+    It must run before the handlers that store the data. The size limits, of
+    each file and of all of them, and the format (from the leading magic
+    bytes) are checked chunk by chunk, and the number of files as each one
+    starts. The upload is aborted as soon as a check fails, without reading
+    the rest of the request body. The failure is kept in ``errors`` for the view to
+    report, keyed by field name like serializer errors.
+    """
+
+    max_size = MAX_FILE_SIZE_BYTES
+    max_files = MAX_IMAGES_PER_REQUEST
+    max_total_size = MAX_UPLOAD_SIZE_BYTES
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.errors = {}
+        self.files = 0
+        self.total_received = 0
+
+    def new_file(self, *args, **kwargs):
+        super().new_file(*args, **kwargs)
+        self.files += 1
+        if self.files > self.max_files:
+            self.reject(FILE_COUNT_ERROR)
+        self.received = 0
+        self.header = b''
+        self.format_checked = False
+
+    def receive_data_chunk(self, raw_data, start):
+        self.received += len(raw_data)
+        self.total_received += len(raw_data)
+        if self.received > self.max_size:
+            self.reject(FILE_SIZE_ERROR)
+        if self.total_received > self.max_total_size:
+            self.reject(UPLOAD_SIZE_ERROR)
+        if not self.format_checked:
+            self.header += raw_data[: IMAGE_SIGNATURE_LENGTH - len(self.header)]
+            if len(self.header) >= IMAGE_SIGNATURE_LENGTH:
+                self.check_format()
+        return raw_data
+
+    def file_complete(self, file_size):
+        # Files shorter than the longest signature are checked at the end
+        if not self.format_checked and sniff_image_format(self.header) is None:
+            self.errors.setdefault(self.field_name, []).append(FILE_FORMAT_ERROR)
+        return None
+
+    def check_format(self):
+        self.format_checked = True
+        if sniff_image_format(self.header) is None:
+            self.reject(FILE_FORMAT_ERROR)
+
+    def reject(self, message):
+        self.errors.setdefault(self.field_name, []).append(message)
+        raise StopUpload(connection_reset=True)
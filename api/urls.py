@@ -5,13 +5,22 @@ from api.views import (
     TicketDetailAPIView,
     UserRegistrationAPIView,
     TicketListCreateAPIView,
+    TicketBulkCreateAPIView,
+    TicketExportAPIView,
+    TicketStatsAPIView,
     TicketImagesAPIView,
+    TicketEventsView,
+    UserTicketEventsView,
 )
 
 urlpatterns = [
     path('login/', views.obtain_auth_token),
     path('register/', UserRegistrationAPIView.as_view(), name='user_registration'),
     path('tickets/', TicketListCreateAPIView.as_view(), name='ticket_list_create'),
+    path('tickets/bulk/', TicketBulkCreateAPIView.as_view(), name='ticket_bulk_create'),
+    path('tickets/export/', TicketExportAPIView.as_view(), name='ticket_export'),
+    path('tickets/stats/', TicketStatsAPIView.as_view(), name='ticket_stats'),
+    path('tickets/events/', UserTicketEventsView.as_view(), name='user_ticket_events'),
     path(
         'tickets/<int:ticket_id>/', TicketDetailAPIView.as_view(), name='ticket_detail'
     ),
@@ -20,4 +29,9 @@ urlpatterns = [
         TicketImagesAPIView.as_view(),
         name='ticket_images',
     ),
+    path(
+        'tickets/<int:ticket_id>/events/',
+        TicketEventsView.as_view(),
+        name='ticket_events',
+    ),
 ]
@@ -1,14 +1,69 @@
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
 import cloudinary
 from cloudinary.uploader import upload as cloudinary_upload
 
+# Leading bytes identifying each accepted image format
+IMAGE_SIGNATURES = {
+    'jpeg': (b'\xff\xd8\xff',),
+    'png': (b'\x89PNG\r\n\x1a\n',),
+    'gif': (b'GIF87a', b'GIF89a'),
+}
+IMAGE_SIGNATURE_LENGTH = max(
+    len(signature)
+    for signatures in IMAGE_SIGNATURES.values()
+    for signature in signatures
+)
+
+
+def sniff_image_format(header):
+    """Return the image format matching the given leading bytes, or None."""
+    for image_format, signatures in IMAGE_SIGNATURES.items():
+        if header.startswith(signatures):
+            return image_format
+    return None
+
 
 class ImageUploader:
-    def __init__(self, strategy):
+    def __init__(self, strategy, max_concurrency=1):
         self.strategy = strategy
+        self.max_concurrency = max_concurrency
+        self._executor = None
+        self._executor_lock = threading.Lock()
 
     def upload_image(self, image_file, **kwargs):
         return self.strategy.upload_image(image_file, **kwargs)
 
+    def upload_images(self, image_files, **kwargs):
+        """Upload several images concurrently and return their URLs in order."""
+        return self.map(
+            lambda image_file: self.upload_image(image_file, **kwargs), image_files
+        )
+
+    def map(self, func, items):
+        """
+        Call ``func`` on each item, up to ``max_concurrency`` at a time, and
+        return the results in order. The thread pool is shared by every
+        caller, so it also bounds the uploads in flight across concurrently
+        running jobs.
+        """
+        if self.max_concurrency <= 1 or len(items) <= 1:
+            return [func(item) for item in items]
+        executor = self._get_executor()
+        futures = [executor.submit(func, item) for item in items]
+        return [future.result() for future in futures]
+
+    def _get_executor(self):
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(
+                    self.max_concurrency, thread_name_prefix='image-upload'
+                )
+            return self._executor
+
 
 class CloudinaryStrategy:
     def __init__(self):
@@ -20,3 +75,24 @@ class CloudinaryStrategy:
     def upload_image(self, image_file, **kwargs):
         response = cloudinary_upload(image_file, **kwargs)
         return response['url']
+
+
+class InMemoryStrategy:
+    """
+    Keeps uploaded images in memory, optionally waiting ``latency`` seconds
+    per upload to mimic a remote service. Meant for tests and benchmarks.
+    """
+
+    def __init__(self, latency=0):
+        self.latency = latency
+        self.images = {}
+        self._lock = threading.Lock()
+
+    def upload_image(self, image_file, **kwargs):
+        content = image_file.read()
+        if self.latency:
+            time.sleep(self.latency)
+        url = f'memory://images/{uuid.uuid4().hex}'
+        with self._lock:
+            self.images[url] = content
+        return url
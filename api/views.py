@@ -1,21 +1,62 @@
-from django.forms import ValidationError
+import json
+
+from asgiref.sync import sync_to_async
+from django.core.handlers.asgi import ASGIRequest
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.shortcuts import get_object_or_404
+from django.middleware.gzip import re_accepts_gzip
+from django.utils.cache import (
+    get_conditional_response,
+    patch_cache_control,
+    patch_vary_headers,
+    quote_etag,
+)
+from django.utils.http import http_date
+from django.utils.text import compress_sequence
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Prefetch
+from django.views import View
+from prometheus_client import CONTENT_TYPE_LATEST
 from rest_framework import generics, status
+from rest_framework.exceptions import AuthenticationFailed, NotFound, ValidationError
+from rest_framework.parsers import JSONParser
+from rest_framework.renderers import BrowsableAPIRenderer
 from rest_framework.response import Response
 from django.contrib.auth.models import User
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from django_filters.rest_framework import DjangoFilterBackend
 
-from .models import Image, Ticket
+from .models import ArchivedImage, ArchivedTicket, Image, Ticket, TicketStats
 from .serializers import (
+    MAX_EMBEDDED_IMAGES,
+    MAX_TICKETS_PER_REQUEST,
+    ImageBatchUploadSerializer,
     ImageUploadSerializer,
     UserSerializer,
     TicketSerializer,
+    TicketStatsSerializer,
+    TicketValuesSerializer,
     ImageSerializer,
 )
-from .authentication import BearerTokenAuthentication
-from .pagination import TicketPagination
-from .tasks import upload_image_to_cloudinary
+from .authentication import CachedBearerTokenAuthentication
+from .cache import get_cached_ticket, set_cached_ticket
+from .events import get_event_broker, ticket_channel, user_channel
+from .export import EXPORT_CHUNK_SIZE, aiter_chunks, export_csv, export_ndjson
+from .filters import ArchivedTicketFilter, TicketFilter
+from .metrics import render_metrics
+from .pagination import (
+    ImageCursorPagination,
+    TicketCursorPagination,
+    TicketPagination,
+)
+from .parsers import NDJSONParser
+from .renderers import FastJSONRenderer
+from .scheduling import get_upload_scheduler
+from .staging import stage_image
+from .stats import record_tickets_created
+from .throttling import ImageUploadBytesThrottle, ReadThrottle, TicketCreateThrottle
+from .upload_handlers import ImageUploadGuardHandler
 
 
 class UserRegistrationAPIView(generics.CreateAPIView):
@@ -31,32 +72,227 @@ class UserRegistrationAPIView(generics.CreateAPIView):
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
 
-class TicketListCreateAPIView(generics.ListCreateAPIView):
+class ArchivedTicketsMixin:
+    """Reads the archived tickets instead of the hot ones with ?archived=true."""
+
+    @property
+    def archived(self):
+        return self.request is not None and self.request.query_params.get(
+            'archived'
+        ) in ('true', '1')
+
+    @property
+    def filterset_class(self):
+        return ArchivedTicketFilter if self.archived else TicketFilter
+
+    def get_queryset(self):
+        model = ArchivedTicket if self.archived else Ticket
+        return model.objects.filter(user=self.request.user)
+
+
+class TicketListCreateAPIView(ArchivedTicketsMixin, generics.ListCreateAPIView):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [BearerTokenAuthentication]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [TicketCreateThrottle, ReadThrottle]
+    renderer_classes = [FastJSONRenderer, BrowsableAPIRenderer]
     filter_backends = [DjangoFilterBackend]
-    filterset_fields = ['status', 'created_at']
-    pagination_class = TicketPagination
+    pagination_class = TicketCursorPagination
+    # Related data that ?include= can embed
+    includes = ['images']
+
+    @property
+    def paginator(self):
+        # Clients asking for a page number keep the counted page-number
+        # pagination, as do searches, which are ordered by rank
+        if (
+            not hasattr(self, '_paginator')
+            and self.request is not None
+            and {TicketPagination.page_query_param, 'q'}
+            & set(self.request.query_params)
+        ):
+            self._paginator = TicketPagination()
+        return super().paginator
+
+    def get_fieldset(self):
+        """
+        Return the fields asked for with ?fields=id,status (in the order of
+        TicketSerializer, or None for all) and the related data asked for
+        with ?include=images.
+        """
+        params = self.request.query_params
+        fields = None
+        if params.get('fields'):
+            names = set(params['fields'].split(','))
+            unknown = names - set(TicketSerializer.Meta.fields)
+            if unknown:
+                raise ValidationError(
+                    {'fields': [f'Unknown fields: {", ".join(sorted(unknown))}.']}
+                )
+            fields = [name for name in TicketSerializer.Meta.fields if name in names]
+        include = set(filter(None, params.get('include', '').split(',')))
+        unknown = include - set(self.includes)
+        if unknown:
+            raise ValidationError(
+                {'include': [f'Unknown includes: {", ".join(sorted(unknown))}.']}
+            )
+        return fields, include
+
+    def list(self, request, *args, **kwargs):
+        fields, include = self.get_fieldset()
+        queryset = self.filter_queryset(self.get_queryset())
+        if include:
+            # Related data is read with one query per page
+            if fields is not None:
+                queryset = queryset.only(*fields)
+            image_model = ArchivedImage if self.archived else Image
+            images = image_model.objects.only(*ImageSerializer.Meta.fields)
+            images = images.order_by('id')[:MAX_EMBEDDED_IMAGES]
+            queryset = queryset.prefetch_related(
+                Prefetch('images', queryset=images, to_attr='embedded_images')
+            )
+            page = self.paginate_queryset(queryset)
+            serializer = self.get_serializer(
+                page, many=True, fields=fields, include=include
+            )
+            return self.get_paginated_response(serializer.data)
+        # Otherwise pages are read as dicts and rendered as they are, without
+        # building model instances or running the serializer fields
+        serializer = TicketValuesSerializer(fields)
+        queryset = queryset.values(*serializer.columns)
+        page = self.paginate_queryset(queryset)
+        if page is not None:
+            return self.get_paginated_response(serializer.to_representation(page))
+        return Response(serializer.to_representation(list(queryset)))
 
     def perform_create(self, serializer):
-        serializer.save(user=self.request.user)
+        with transaction.atomic():
+            ticket = serializer.save(user=self.request.user)
+            record_tickets_created(self.request.user.id, [ticket])
 
-    def get_queryset(self):
-        queryset = super().get_queryset()
-        return queryset.filter(user=self.request.user)
+
+class TicketBulkCreateAPIView(generics.GenericAPIView):
+    queryset = Ticket.objects.all()
+    serializer_class = TicketSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [TicketCreateThrottle]
+    parser_classes = [JSONParser, NDJSONParser]
+
+    def get_serializer(self, *args, **kwargs):
+        kwargs.update(many=True, allow_empty=False, max_length=MAX_TICKETS_PER_REQUEST)
+        return super().get_serializer(*args, **kwargs)
+
+    def post(self, request, *args, **kwargs):
+        items = request.data
+        serializer = self.get_serializer(data=items)
+        if serializer.is_valid():
+            item_errors = [{}] * len(items)
+        else:
+            item_errors = serializer.errors
+            # Errors about the request as a whole, like a body that is not a list
+            if not isinstance(item_errors, list):
+                return Response(item_errors, status=status.HTTP_400_BAD_REQUEST)
+            # The valid tickets are still created; the others are reported
+            serializer = self.get_serializer(
+                data=[item for item, errors in zip(items, item_errors) if not errors]
+            )
+        created = []
+        if serializer.is_valid():
+            with transaction.atomic():
+                tickets = serializer.save(user=request.user)
+                record_tickets_created(request.user.id, tickets)
+            created = serializer.data
+        results = []
+        tickets = iter(created)
+        for index, errors in enumerate(item_errors):
+            if errors:
+                results.append({'index': index, 'status': 400, 'errors': errors})
+            else:
+                results.append({'index': index, 'status': 201, 'ticket': next(tickets)})
+        if not created:
+            response_status = status.HTTP_400_BAD_REQUEST
+        elif len(created) < len(items):
+            response_status = status.HTTP_207_MULTI_STATUS
+        else:
+            response_status = status.HTTP_201_CREATED
+        return Response({'results': results}, status=response_status)
+
+
+class TicketExportAPIView(ArchivedTicketsMixin, generics.GenericAPIView):
+    """
+    Streams all of the user's tickets matching the list filters, as NDJSON
+    or, with ?output=csv, as CSV. Gzipped when the client accepts it.
+    """
+
+    queryset = Ticket.objects.all()
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [ReadThrottle]
+    filter_backends = [DjangoFilterBackend]
+    outputs = {
+        'ndjson': ('application/x-ndjson', export_ndjson),
+        'csv': ('text/csv; charset=utf-8', export_csv),
+    }
+
+    def get(self, request, *args, **kwargs):
+        output = request.query_params.get('output', 'ndjson')
+        if output not in self.outputs:
+            raise ValidationError(
+                {'output': [f'Choose one of: {", ".join(self.outputs)}.']}
+            )
+        content_type, export = self.outputs[output]
+        serializer = TicketValuesSerializer()
+        # Read in chunks, through a server-side cursor where the database
+        # has them, so memory use does not grow with the number of tickets
+        rows = (
+            self.filter_queryset(self.get_queryset())
+            .values(*serializer.columns)
+            .iterator(chunk_size=EXPORT_CHUNK_SIZE)
+        )
+        rows = serializer.iter_representation(rows)
+        content = export(rows, serializer.fields) if output == 'csv' else export(rows)
+        headers = {'Content-Disposition': f'attachment; filename="tickets.{output}"'}
+        if re_accepts_gzip.search(request.META.get('HTTP_ACCEPT_ENCODING', '')):
+            content = compress_sequence(content)
+            headers['Content-Encoding'] = 'gzip'
+        if isinstance(request._request, ASGIRequest):
+            content = aiter_chunks(content)
+        response = StreamingHttpResponse(
+            content, content_type=content_type, headers=headers
+        )
+        patch_vary_headers(response, ['Accept-Encoding'])
+        return response
 
 
 class TicketImagesAPIView(generics.ListCreateAPIView):
     queryset = Image.objects.all()
     serializer_class = ImageSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [BearerTokenAuthentication]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [ImageUploadBytesThrottle, ReadThrottle]
+
+    pagination_class = ImageCursorPagination
 
     def get_queryset(self):
+        # Ownership is checked once on the ticket's primary key, so the
+        # images are read from their index without joining the tickets
         ticket_id = self.kwargs['ticket_id']
-        return Image.objects.filter(ticket_id=ticket_id, ticket__user=self.request.user)
+        ticket_model, image_model = Ticket, Image
+        if self.request.query_params.get('archived') in ('true', '1'):
+            ticket_model, image_model = ArchivedTicket, ArchivedImage
+        if not ticket_model.objects.filter(
+            pk=ticket_id, user=self.request.user
+        ).exists():
+            raise NotFound('Ticket not found')
+        return image_model.objects.filter(ticket_id=ticket_id)
+
+    def initial(self, request, *args, **kwargs):
+        # Validate uploads while they stream in, before the body is parsed
+        self.upload_guard = ImageUploadGuardHandler(request)
+        request.upload_handlers.insert(0, self.upload_guard)
+        super().initial(request, *args, **kwargs)
 
     def create(self, request, *args, **kwargs):
         ticket_id = kwargs['ticket_id']
@@ -71,23 +307,181 @@ class TicketImagesAPIView(generics.ListCreateAPIView):
                 {'error': 'Cannot upload more images. Ticket status is completed.'},
                 status=status.HTTP_400_BAD_REQUEST,
             )
-        serializer = ImageUploadSerializer(data=request.data)
+        # Parsing the body runs the upload guard installed in initial()
+        data = request.data
+        if self.upload_guard.errors:
+            return Response(
+                self.upload_guard.errors, status=status.HTTP_400_BAD_REQUEST
+            )
+        # Several files sent under 'images' are stored by a single job
+        if 'images' in data:
+            return self.create_batch(request, ticket)
+        serializer = ImageUploadSerializer(data=data)
         if serializer.is_valid():
             image = serializer.validated_data['image']
-            upload_image_to_cloudinary.delay(image.read(), ticket_id)
+            staged_image = stage_image(image, ticket_id)
+            get_upload_scheduler().submit(ticket, [staged_image])
             return Response(
                 {'message': 'Image uploaded successfully'},
                 status=status.HTTP_201_CREATED,
             )
         return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
 
+    def create_batch(self, request, ticket):
+        serializer = ImageBatchUploadSerializer(data=request.data)
+        if not serializer.is_valid():
+            return Response(serializer.errors, status=status.HTTP_400_BAD_REQUEST)
+        images = serializer.validated_data['images']
+        remaining = ticket.num_images - ticket.uploaded_images
+        if len(images) > remaining:
+            return Response(
+                {'error': f'Ticket only accepts {remaining} more images.'},
+                status=status.HTTP_400_BAD_REQUEST,
+            )
+        staged_images = [stage_image(image, ticket.id) for image in images]
+        get_upload_scheduler().submit(ticket, staged_images)
+        return Response(
+            {'message': f'{len(images)} images uploaded successfully'},
+            status=status.HTTP_201_CREATED,
+        )
 
-class TicketDetailAPIView(generics.RetrieveAPIView):
+
+class TicketDetailAPIView(ArchivedTicketsMixin, generics.RetrieveAPIView):
     queryset = Ticket.objects.all()
     serializer_class = TicketSerializer
     permission_classes = [IsAuthenticated]
-    authentication_classes = [BearerTokenAuthentication]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [ReadThrottle]
+
+    def get_object(self):
+        return get_object_or_404(self.get_queryset(), pk=self.kwargs.get('ticket_id'))
+
+    def retrieve(self, request, *args, **kwargs):
+        # Archived tickets no longer change and are rarely read; not cached
+        if self.archived:
+            return Response(self.get_serializer(self.get_object()).data)
+        # Polling clients are answered from the cache, and with a 304 when
+        # their ETag or Last-Modified date is still current
+        cached_ticket, version = get_cached_ticket(self.kwargs.get('ticket_id'))
+        if cached_ticket is None or cached_ticket['user_id'] != request.user.id:
+            ticket = self.get_object()
+            cached_ticket = set_cached_ticket(
+                ticket, self.get_serializer(ticket).data, version
+            )
+        updated_at = cached_ticket['updated_at']
+        etag = quote_etag(f'{self.kwargs.get("ticket_id")}-{updated_at.timestamp()}')
+        last_modified = int(updated_at.timestamp())
+        response = Response(cached_ticket['data'])
+        response['ETag'] = etag
+        response['Last-Modified'] = http_date(last_modified)
+        patch_cache_control(response, private=True, no_cache=True)
+        patch_vary_headers(response, ['Authorization'])
+        return get_conditional_response(
+            request._request,
+            etag=etag,
+            last_modified=last_modified,
+            response=response,
+        )
+
+
+class TicketStatsAPIView(generics.RetrieveAPIView):
+    serializer_class = TicketStatsSerializer
+    permission_classes = [IsAuthenticated]
+    authentication_classes = [CachedBearerTokenAuthentication]
+    throttle_classes = [ReadThrottle]
 
     def get_object(self):
-        ticket_id = self.kwargs.get('ticket_id')
-        return get_object_or_404(Ticket, pk=ticket_id, user=self.request.user)
+        # Users without tickets have no stats row yet
+        stats = TicketStats.objects.filter(user=self.request.user).first()
+        return stats or TicketStats(user=self.request.user)
+
+
+def format_event(event):
+    return f'event: ticket\ndata: {json.dumps(event)}\n\n'
+
+
+class TicketEventsBaseView(View):
+    """
+    Server-sent events for ticket status changes, published by the upload
+    task when a ticket is completed. Needs an ASGI server to stream.
+    """
+
+    async def authenticate(self, request):
+        authentication = CachedBearerTokenAuthentication()
+        try:
+            result = await sync_to_async(authentication.authenticate)(request)
+        except AuthenticationFailed:
+            return None
+        return result[0] if result else None
+
+    async def get(self, request, *args, **kwargs):
+        # Under WSGI the whole stream would be collected in memory, holding
+        # the worker, before anything is sent
+        if not isinstance(request, ASGIRequest):
+            return JsonResponse(
+                {'error': 'Ticket events are only served by the ASGI application'},
+                status=status.HTTP_501_NOT_IMPLEMENTED,
+            )
+        user = await self.authenticate(request)
+        if user is None:
+            return JsonResponse(
+                {'detail': 'Authentication credentials were not provided.'},
+                status=status.HTTP_401_UNAUTHORIZED,
+            )
+        return await self.stream(request, user, *args, **kwargs)
+
+    def streaming_response(self, events):
+        response = StreamingHttpResponse(events, content_type='text/event-stream')
+        response['Cache-Control'] = 'no-cache'
+        response['X-Accel-Buffering'] = 'no'
+        return response
+
+    async def events(self, channels, current_state=None, until_completed=False):
+        heartbeat = settings.TICKET_EVENTS_HEARTBEAT
+        async with get_event_broker().subscribe(*channels) as subscription:
+            # Subscribed before reading the current state, so no change is missed
+            if current_state is not None:
+                event = await current_state()
+                yield format_event(event)
+                if until_completed and event['status'] == 'COMPLETED':
+                    return
+            while True:
+                event = await subscription.get(timeout=heartbeat)
+                if event is None:
+                    yield ': keep-alive\n\n'
+                    continue
+                yield format_event(event)
+                if until_completed and event['status'] == 'COMPLETED':
+                    return
+
+
+class TicketEventsView(TicketEventsBaseView):
+    async def stream(self, request, user, ticket_id):
+        ticket = (
+            await Ticket.objects.filter(pk=ticket_id, user=user)
+            .values('id', 'status')
+            .afirst()
+        )
+        if ticket is None:
+            return JsonResponse(
+                {'error': 'Ticket not found'}, status=status.HTTP_404_NOT_FOUND
+            )
+
+        async def current_state():
+            return await Ticket.objects.values('id', 'status').aget(pk=ticket_id)
+
+        return self.streaming_response(
+            self.events(
+                [ticket_channel(ticket_id)], current_state, until_completed=True
+            )
+        )
+
+
+class UserTicketEventsView(TicketEventsBaseView):
+    async def stream(self, request, user):
+        return self.streaming_response(self.events([user_channel(user.pk)]))
+
+
+class MetricsView(View):
+    def get(self, request):
+        return HttpResponse(render_metrics(), content_type=CONTENT_TYPE_LATEST)
@@ -0,0 +1,96 @@
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from django.conf import settings
+from django.db import close_old_connections
+from prometheus_client import start_http_server
+from rq.timeouts import TimerDeathPenalty
+from rq.worker import SimpleWorker, WorkerStatus
+
+from .imaging import shutdown_process_pool, start_process_pool
+
+
+class ConcurrentWorker(SimpleWorker):
+    """
+    RQ worker that performs up to ``concurrency`` jobs at a time in a thread
+    pool instead of forking a work horse per job.
+
+    Upload jobs mostly wait on the network, so one process can keep many of
+    them in flight while sharing its Django setup, database connections and
+    HTTP connection pool. Run it with:
+
+        python manage.py rqworker default --worker-class api.workers.ConcurrentWorker
+    """
+
+    # Signal based timeouts only work in the main thread
+    death_penalty_class = TimerDeathPenalty
+
+    def __init__(self, *args, concurrency=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.concurrency = concurrency or settings.RQ_WORKER_CONCURRENCY
+        self._slots = threading.BoundedSemaphore(self.concurrency)
+        self._executor = ThreadPoolExecutor(
+            self.concurrency, thread_name_prefix='rq-job'
+        )
+        self._running_lock = threading.Lock()
+        self.running_jobs = 0
+
+    def register_birth(self):
+        super().register_birth()
+        # Read by api.metrics.QueueCollector to report worker utilization
+        self.connection.hset(
+            self.key, mapping={'concurrency': self.concurrency, 'running_jobs': 0}
+        )
+        # Job metrics are kept in this process unless PROMETHEUS_MULTIPROC_DIR
+        # shares them with the web processes
+        if settings.RQ_WORKER_METRICS_PORT:
+            start_http_server(settings.RQ_WORKER_METRICS_PORT)
+        # Started once, before any job thread, and shared by all jobs
+        if settings.IMAGE_OPTIMIZATION_ENABLED:
+            start_process_pool()
+
+    # RQ keeps a single current job, and its working time, in the worker's
+    # hash. They don't apply to a worker running several jobs at once, and
+    # would be overwritten by each job; running_jobs counts them instead,
+    # and the queues' started job registries list them.
+
+    def set_current_job_id(self, job_id=None, pipeline=None):
+        pass
+
+    def set_current_job_working_time(self, current_job_working_time, pipeline=None):
+        pass
+
+    def update_running_jobs(self, change):
+        with self._running_lock:
+            self.running_jobs += change
+            self.connection.hset(self.key, 'running_jobs', self.running_jobs)
+
+    def dequeue_job_and_maintain_ttl(self, timeout, max_idle_time=None):
+        # Only take a job off the queue once a thread is free to run it,
+        # keeping the worker registered while all threads are busy
+        while not self._slots.acquire(timeout=self.worker_ttl / 3):
+            self.heartbeat()
+        result = super().dequeue_job_and_maintain_ttl(timeout, max_idle_time)
+        if result is None:
+            self._slots.release()
+        return result
+
+    def execute_job(self, job, queue):
+        self.update_running_jobs(1)
+        self.set_state(WorkerStatus.BUSY)
+        self._executor.submit(self._perform_job_in_thread, job, queue)
+
+    def _perform_job_in_thread(self, job, queue):
+        try:
+            self.perform_job(job, queue)
+        finally:
+            # Closes connections past CONN_MAX_AGE, keeps the others for reuse
+            close_old_connections()
+            self.update_running_jobs(-1)
+            self._slots.release()
+
+    def teardown(self):
+        # Let running jobs finish before the worker is unregistered
+        self._executor.shutdown(wait=True)
+        shutdown_process_pool()
+        super().teardown()
@@ -54,6 +54,7 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.middleware.RequestMetricsMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -105,6 +106,102 @@ DATABASES = {
     }
 }
 
+# Cache shared by all web and worker processes. Cached tokens and tickets are
+# invalidated through it, so it must not be a per-process cache like locmem
+# when more than one process runs.
+
+CACHES = {
+    'default': env.cache('CACHE_URL', default='rediscache://localhost:6379/1'),
+}
+
+# Authenticated tokens are cached in-process for TOKEN_AUTH_LOCAL_CACHE_TIMEOUT
+# seconds and in the shared cache for TOKEN_AUTH_CACHE_TIMEOUT seconds
+
+TOKEN_AUTH_CACHE_TIMEOUT = 300
+TOKEN_AUTH_LOCAL_CACHE_TIMEOUT = 5
+TOKEN_AUTH_LOCAL_CACHE_SIZE = 1024
+
+# Serialized tickets are cached for ticket detail requests
+
+TICKET_CACHE_TIMEOUT = 300
+
+# Ticket status events, published by the upload task and streamed to clients.
+# InMemoryEventBroker only works when web and worker share a process.
+
+TICKET_EVENTS_BROKER = 'api.events.RedisEventBroker'
+TICKET_EVENTS_REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+TICKET_EVENTS_HEARTBEAT = 15
+
+# Uploads in flight per worker process, and jobs run at once by
+# api.workers.ConcurrentWorker
+
+IMAGE_UPLOAD_CONCURRENCY = env.int('IMAGE_UPLOAD_CONCURRENCY', default=8)
+RQ_WORKER_CONCURRENCY = env.int('RQ_WORKER_CONCURRENCY', default=8)
+
+# Port on which api.workers.ConcurrentWorker serves its upload job metrics
+# when they are not shared through PROMETHEUS_MULTIPROC_DIR
+
+RQ_WORKER_METRICS_PORT = env.int('RQ_WORKER_METRICS_PORT', default=None)
+
+# Upload jobs are released to RQ by api.scheduling.UploadScheduler: users (or
+# tickets, with UPLOAD_SCHEDULER_FAIR_SHARE = 'ticket') take turns, lanes are
+# visited in proportion to their weights, and at most MAX_IN_FLIGHT jobs (about
+# the number of worker slots) are queued or running, MAX_IN_FLIGHT_PER_USER per
+# user. Jobs completing their ticket or smaller than SMALL_JOB_BYTES use the
+# first lane. A job holds its slot for at most UPLOAD_SCHEDULER_LEASE seconds.
+
+UPLOAD_SCHEDULER_LANES = {'high': 3, 'default': 1}
+UPLOAD_SCHEDULER_SMALL_JOB_BYTES = 1024 * 1024
+UPLOAD_SCHEDULER_MAX_IN_FLIGHT = env.int('UPLOAD_SCHEDULER_MAX_IN_FLIGHT', default=16)
+UPLOAD_SCHEDULER_MAX_IN_FLIGHT_PER_USER = env.int(
+    'UPLOAD_SCHEDULER_MAX_IN_FLIGHT_PER_USER', default=4
+)
+UPLOAD_SCHEDULER_FAIR_SHARE = 'user'
+UPLOAD_SCHEDULER_LEASE = 600
+
+# Optional re-encoding of images in the upload job: sides are capped at
+# IMAGE_OPTIMIZATION_MAX_DIMENSION pixels, JPEGs saved at the given quality and
+# metadata dropped. In api.workers.ConcurrentWorker, encoding runs in a pool of
+# IMAGE_OPTIMIZATION_PROCESSES processes (one per CPU by default); in rq's
+# default forking worker it runs in the job's work horse.
+
+IMAGE_OPTIMIZATION_ENABLED = env.bool('IMAGE_OPTIMIZATION_ENABLED', default=False)
+IMAGE_OPTIMIZATION_MAX_DIMENSION = env.int(
+    'IMAGE_OPTIMIZATION_MAX_DIMENSION', default=2048
+)
+IMAGE_OPTIMIZATION_QUALITY = env.int('IMAGE_OPTIMIZATION_QUALITY', default=85)
+IMAGE_OPTIMIZATION_PROCESSES = env.int('IMAGE_OPTIMIZATION_PROCESSES', default=None)
+
+# Per-user token buckets of api.throttling, checked before a request does any
+# work. Rates are 'tokens/period' (s, min, hour or day); a bucket holds a
+# period's worth of tokens and refills evenly. Ticket creation spends a token
+# per ticket, image uploads one per byte of the request body, and reads one
+# per request. Set a rate to None to disable its throttle.
+
+THROTTLE_BACKEND = 'api.throttling.RedisTokenBucket'
+THROTTLE_REDIS_URL = env('REDIS_URL', default='redis://localhost:6379/0')
+THROTTLE_RATES = {
+    'ticket_create': env('THROTTLE_TICKET_CREATE_RATE', default='2000/hour'),
+    'image_upload_bytes': env(
+        'THROTTLE_IMAGE_UPLOAD_BYTES_RATE', default=f'{1024 ** 3}/hour'
+    ),
+    'read': env('THROTTLE_READ_RATE', default='600/min'),
+}
+
+# Tickets completed more than TICKET_ARCHIVE_AFTER_DAYS days ago are moved to
+# the archive tables by `python manage.py archive_tickets`; the ticket views
+# read them with ?archived=true.
+
+TICKET_ARCHIVE_AFTER_DAYS = env.int('TICKET_ARCHIVE_AFTER_DAYS', default=90)
+
+# Request metrics are served at /metrics in the Prometheus text format. Requests
+# slower than REQUEST_METRICS_SLOW_THRESHOLD seconds are logged with their SQL.
+# Set PROMETHEUS_MULTIPROC_DIR when the server runs several processes.
+
+REQUEST_METRICS_SLOW_THRESHOLD = env.float(
+    'REQUEST_METRICS_SLOW_THRESHOLD', default=None
+)
+
 RQ_QUEUES = {
     'default': {
         'HOST': 'localhost',
@@ -150,6 +247,25 @@ USE_TZ = True
 
 STATIC_URL = 'static/'
 
+# File storages. Uploaded images are spooled to the 'staging' storage and only
+# a reference to them is enqueued; point it at shared storage when web and
+# worker processes run on different hosts.
+
+STORAGES = {
+    'default': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+    },
+    'staticfiles': {
+        'BACKEND': 'django.contrib.staticfiles.storage.StaticFilesStorage',
+    },
+    'staging': {
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {
+            'location': env('IMAGE_STAGING_DIR', default=str(BASE_DIR / 'staging')),
+        },
+    },
+}
+
 # Default primary key field type
 # https://docs.djangoproject.com/en/5.0/ref/settings/#default-auto-field
 
@@ -21,6 +21,8 @@ from rest_framework import permissions
 from drf_yasg.views import get_schema_view
 from drf_yasg import openapi
 
+from api.views import MetricsView
+
 
 schema_view = get_schema_view(
     openapi.Info(
@@ -37,6 +39,7 @@ schema_view = get_schema_view(
 urlpatterns = [
     path('admin/', admin.site.urls),
     path('api/v1/', include('api.urls')),
+    path('metrics', MetricsView.as_view(), name='metrics'),
     # drf-yasg URLs
     path(
         'documentation/',
@@ -0,0 +1,294 @@
+"""
+Measure latency, throughput and database queries of the API endpoints
+in-process against a seeded database, without Redis or Cloudinary:
+
+    python -m benchmarks.endpoints --users 20 --tickets 500 --output before.json
+    python -m benchmarks.endpoints --users 20 --tickets 500 --compare before.json
+
+Upload jobs run inline instead of being enqueued and store images with an
+in-memory strategy. Set BENCHMARK_DATABASE_URL to run against PostgreSQL.
+"""
+
+import argparse
+import json
+import os
+import platform
+import random
+import shutil
+import statistics
+import subprocess
+import time
+from datetime import datetime, timezone
+from unittest import mock
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.contrib.auth.hashers import make_password  # noqa: E402
+from django.contrib.auth.models import User  # noqa: E402
+from django.core.files.uploadedfile import SimpleUploadedFile  # noqa: E402
+from django.db import connection  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    CaptureQueriesContext,
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+from rest_framework.authtoken.models import Token  # noqa: E402
+from rest_framework.test import APIClient  # noqa: E402
+
+from api import tasks  # noqa: E402
+from api.models import Image, Ticket  # noqa: E402
+from api.stats import rebuild_ticket_stats  # noqa: E402
+from api.utils import ImageUploader, InMemoryStrategy  # noqa: E402
+
+BATCH_SIZE = 1000
+WORDS = (
+    'printer scanner login password network email invoice refund laptop '
+    'screen battery update crash slow error access account license vpn'
+).split()
+
+
+class InlineUploadScheduler:
+    """Runs upload jobs as they are submitted instead of queueing them."""
+
+    def submit(self, ticket, staged_images):
+        tasks.upload_images_to_cloudinary(staged_images, ticket.id)
+
+
+def sentence(words):
+    return ' '.join(random.choice(WORDS) for _ in range(words))
+
+
+def seed(users, tickets_per_user, images_per_ticket):
+    """Create users with tokens, their tickets and images with bulk inserts."""
+    password = make_password(None)
+    user_objs = User.objects.bulk_create(
+        [User(username=f'user{i}', password=password) for i in range(users)]
+    )
+    Token.objects.bulk_create(
+        [Token(user=user, key=Token.generate_key()) for user in user_objs]
+    )
+    for user in user_objs:
+        # Half the tickets have all their images and are completed
+        tickets = Ticket.objects.bulk_create(
+            [
+                Ticket(
+                    user=user,
+                    title=sentence(4),
+                    description=sentence(20),
+                    num_images=images_per_ticket,
+                    uploaded_images=images_per_ticket if i % 2 else 0,
+                    status='COMPLETED' if i % 2 else 'CREATED',
+                )
+                for i in range(tickets_per_user)
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        Image.objects.bulk_create(
+            (
+                Image(
+                    ticket=ticket,
+                    cloudinary_url=f'memory://images/{ticket.id}/{n}',
+                    original_size=1024,
+                    uploaded_size=1024,
+                )
+                for ticket in tickets
+                if ticket.status == 'COMPLETED'
+                for n in range(images_per_ticket)
+            ),
+            batch_size=BATCH_SIZE,
+        )
+    rebuild_ticket_stats()
+
+
+def get_scenarios():
+    """Map endpoint names to functions making one request as a random user."""
+    clients = []
+    for token in Token.objects.select_related('user'):
+        client = APIClient()
+        client.credentials(HTTP_AUTHORIZATION=f'Bearer {token.key}')
+        ticket_ids = list(
+            Ticket.objects.filter(user=token.user_id).values_list('id', flat=True)
+        )
+        # Upload target that never runs out of expected images
+        upload_ticket = Ticket.objects.create(
+            user=token.user, title='Uploads', description='', num_images=10**9
+        )
+        clients.append((client, ticket_ids, upload_ticket.id))
+
+    def request(make):
+        def run():
+            return make(*random.choice(clients))
+
+        return run
+
+    def upload(client, ticket_ids, upload_ticket_id):
+        content = b'GIF89a' + random.randbytes(1024)
+        return client.post(
+            f'/api/v1/tickets/{upload_ticket_id}/images/',
+            {'image': SimpleUploadedFile('image.gif', content)},
+            format='multipart',
+        )
+
+    return {
+        'ticket_list': request(lambda client, *_: client.get('/api/v1/tickets/')),
+        'ticket_list_100': request(
+            lambda client, *_: client.get('/api/v1/tickets/?page_size=100')
+        ),
+        'ticket_list_images': request(
+            lambda client, *_: client.get('/api/v1/tickets/?include=images')
+        ),
+        'ticket_list_sparse': request(
+            lambda client, *_: client.get('/api/v1/tickets/?fields=id,status')
+        ),
+        'ticket_list_filtered': request(
+            lambda client, *_: client.get('/api/v1/tickets/?status=COMPLETED')
+        ),
+        'ticket_list_page': request(
+            lambda client, *_: client.get('/api/v1/tickets/?page=2')
+        ),
+        'ticket_search': request(
+            lambda client, *_: client.get(f'/api/v1/tickets/?q={random.choice(WORDS)}')
+        ),
+        'ticket_detail': request(
+            lambda client, ticket_ids, _: client.get(
+                f'/api/v1/tickets/{random.choice(ticket_ids)}/'
+            )
+        ),
+        'ticket_stats': request(
+            lambda client, *_: client.get('/api/v1/tickets/stats/')
+        ),
+        'ticket_create': request(
+            lambda client, *_: client.post(
+                '/api/v1/tickets/',
+                {'title': sentence(4), 'description': sentence(20), 'num_images': 1},
+                format='json',
+            )
+        ),
+        'ticket_images_upload': request(upload),
+    }
+
+
+def measure(run, requests, warmup):
+    for _ in range(warmup):
+        run()
+    latencies = []
+    queries = []
+    started = time.perf_counter()
+    for _ in range(requests):
+        with CaptureQueriesContext(connection) as captured:
+            request_started = time.perf_counter()
+            response = run()
+            latencies.append(time.perf_counter() - request_started)
+        if response.status_code >= 400:
+            raise RuntimeError(f'Unexpected response {response.status_code}')
+        queries.append(len(captured))
+    elapsed = time.perf_counter() - started
+    percentiles = statistics.quantiles(latencies, n=100, method='inclusive')
+    return {
+        'requests': requests,
+        'p50_ms': round(percentiles[49] * 1000, 3),
+        'p95_ms': round(percentiles[94] * 1000, 3),
+        'p99_ms': round(percentiles[98] * 1000, 3),
+        'mean_ms': round(statistics.mean(latencies) * 1000, 3),
+        'requests_per_second': round(requests / elapsed, 1),
+        'queries_mean': round(statistics.mean(queries), 2),
+        'queries_max': max(queries),
+    }
+
+
+def git_revision():
+    try:
+        return subprocess.run(
+            ['git', 'rev-parse', '--short', 'HEAD'],
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_results(results, baseline=None):
+    columns = ['p50_ms', 'p95_ms', 'p99_ms', 'requests_per_second', 'queries_mean']
+    print(f'{"endpoint":<22}' + ''.join(f'{column:>21}' for column in columns))
+    for name, result in results.items():
+        cells = []
+        for column in columns:
+            cell = f'{result[column]:g}'
+            previous = (baseline or {}).get(name, {}).get(column)
+            if previous:
+                cell += f' ({(result[column] - previous) / previous:+.0%})'
+            cells.append(f'{cell:>21}')
+        print(f'{name:<22}' + ''.join(cells))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--users', type=int, default=10)
+    parser.add_argument('--tickets', type=int, default=1000, help='per user')
+    parser.add_argument('--images', type=int, default=3, help='per ticket')
+    parser.add_argument('--requests', type=int, default=200, help='per endpoint')
+    parser.add_argument('--warmup', type=int, default=20)
+    parser.add_argument('--upload-latency', type=float, default=0.0)
+    parser.add_argument('--endpoints', nargs='+', help='default: all')
+    parser.add_argument('--seed', type=int, default=0)
+    parser.add_argument('--output', help='save the results to this JSON file')
+    parser.add_argument('--compare', help='JSON results of an earlier run')
+    args = parser.parse_args()
+    random.seed(args.seed)
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    uploader = ImageUploader(
+        InMemoryStrategy(latency=args.upload_latency),
+        settings.IMAGE_UPLOAD_CONCURRENCY,
+    )
+    try:
+        with (
+            mock.patch.object(tasks, 'uploader', uploader),
+            mock.patch('api.views.get_upload_scheduler', InlineUploadScheduler),
+        ):
+            started = time.perf_counter()
+            seed(args.users, args.tickets, args.images)
+            print(f'Seeded in {time.perf_counter() - started:.1f}s')
+            scenarios = get_scenarios()
+            results = {
+                name: measure(scenarios[name], args.requests, args.warmup)
+                for name in args.endpoints or scenarios
+            }
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        shutil.rmtree(settings.STORAGES['staging']['OPTIONS']['location'], True)
+
+    report = {
+        'meta': {
+            'date': datetime.now(timezone.utc).isoformat(timespec='seconds'),
+            'revision': git_revision(),
+            'python': platform.python_version(),
+            'django': django.get_version(),
+            'database': connection.vendor,
+            'users': args.users,
+            'tickets_per_user': args.tickets,
+            'images_per_ticket': args.images,
+            'upload_latency': args.upload_latency,
+        },
+        'results': results,
+    }
+    baseline = None
+    if args.compare:
+        with open(args.compare) as file:
+            baseline = json.load(file)['results']
+    print_results(results, baseline)
+    if args.output:
+        with open(args.output, 'w') as file:
+            json.dump(report, file, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,52 @@
+"""
+Settings for running the benchmarks offline: a throwaway database (SQLite
+unless BENCHMARK_DATABASE_URL is set), local memory cache, in-process events
+and a temporary staging directory. Redis and Cloudinary are not used.
+"""
+
+import os
+import tempfile
+
+for name in (
+    'SECRET_KEY',
+    'POSTGRESQL_NAME',
+    'POSTGRESQL_USER',
+    'POSTGRESQL_PASS',
+    'POSTGRESQL_HOST',
+    'POSTGRESQL_PORT',
+):
+    os.environ.setdefault(name, 'benchmark')
+
+from backend.settings import *  # noqa: E402,F401,F403
+from backend.settings import STORAGES, THROTTLE_RATES, env  # noqa: E402
+
+DEBUG = False
+
+# The test database is created from it, so a Postgres URL is left untouched
+DATABASES = {
+    'default': env.db(
+        'BENCHMARK_DATABASE_URL',
+        default='sqlite:///' + os.path.join(tempfile.gettempdir(), 'benchmark.db'),
+    ),
+}
+
+CACHES = {
+    'default': {'BACKEND': 'django.core.cache.backends.locmem.LocMemCache'},
+}
+
+TICKET_EVENTS_BROKER = 'api.events.InMemoryEventBroker'
+
+# Throttles still run, to be measured, but never reject a request
+THROTTLE_BACKEND = 'api.throttling.InMemoryTokenBucket'
+THROTTLE_RATES = dict.fromkeys(THROTTLE_RATES, f'{10 ** 12}/s')
+
+STORAGES = dict(
+    STORAGES,
+    staging={
+        'BACKEND': 'django.core.files.storage.FileSystemStorage',
+        'OPTIONS': {'location': tempfile.mkdtemp(prefix='benchmark-staging-')},
+    },
+)
+
+# Hashing passwords would dominate seeding; benchmark users never log in
+PASSWORD_HASHERS = ['django.contrib.auth.hashers.MD5PasswordHasher']
@@ -0,0 +1,86 @@
+"""
+Compare the ways of serializing and rendering a page of tickets, and check
+that they produce the same bytes:
+
+    python -m benchmarks.ticket_list --page-size 100 --repeat 200
+
+'serializer' is TicketSerializer with JSONRenderer, as the list view used
+to do; 'values' reads dicts with TicketValuesSerializer and renders them
+with JSONRenderer, the fallback without orjson; 'values+orjson' is the
+list view as it is now.
+"""
+
+import argparse
+import os
+import shutil
+import time
+
+os.environ.setdefault('DJANGO_SETTINGS_MODULE', 'benchmarks.settings')
+
+import django  # noqa: E402
+
+django.setup()
+
+from django.conf import settings  # noqa: E402
+from django.test.utils import (  # noqa: E402
+    setup_databases,
+    setup_test_environment,
+    teardown_databases,
+)
+from rest_framework.renderers import JSONRenderer  # noqa: E402
+
+from api import renderers  # noqa: E402
+from api.models import Ticket  # noqa: E402
+from api.renderers import FastJSONRenderer  # noqa: E402
+from api.serializers import TicketSerializer, TicketValuesSerializer  # noqa: E402
+from benchmarks.endpoints import seed  # noqa: E402
+
+
+def serializer(queryset):
+    return JSONRenderer().render(TicketSerializer(queryset, many=True).data)
+
+
+def values(queryset):
+    rows = list(queryset.values(*TicketValuesSerializer.fields))
+    return JSONRenderer().render(TicketValuesSerializer().to_representation(rows))
+
+
+def values_orjson(queryset):
+    rows = list(queryset.values(*TicketValuesSerializer.fields))
+    return FastJSONRenderer().render(TicketValuesSerializer().to_representation(rows))
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--page-size', type=int, default=100)
+    parser.add_argument('--repeat', type=int, default=200)
+    args = parser.parse_args()
+
+    setup_test_environment()
+    old_config = setup_databases(verbosity=0, interactive=False)
+    try:
+        seed(1, args.page_size, 0)
+        queryset = Ticket.objects.order_by('-id')[: args.page_size]
+        methods = {'serializer': serializer, 'values': values}
+        if renderers.orjson is not None:
+            methods['values+orjson'] = values_orjson
+        expected = serializer(queryset)
+        print(f'{args.page_size} tickets per page, {args.repeat} pages')
+        print(f'{"method":<14} {"ms/page":>9} {"speedup":>8}')
+        baseline = None
+        for name, method in methods.items():
+            if method(queryset) != expected:
+                raise RuntimeError(f'{name} does not match the serializer output')
+            started = time.perf_counter()
+            for _ in range(args.repeat):
+                method(queryset)
+            elapsed = (time.perf_counter() - started) / args.repeat
+            baseline = baseline or elapsed
+            print(f'{name:<14} {elapsed * 1000:>9.3f} {baseline / elapsed:>7.1f}x')
+    finally:
+        teardown_databases(old_config, verbosity=0)
+        shutil.rmtree(settings.STORAGES['staging']['OPTIONS']['location'], True)
+
+
+if __name__ == '__main__':
+    main()
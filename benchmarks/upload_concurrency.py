@@ -0,0 +1,44 @@
+"""
+Compare sequential and concurrent image uploads against a fake strategy
+with artificial latency, without touching Cloudinary:
+
+    python -m benchmarks.upload_concurrency --images 100 --latency 0.05
+"""
+
+import argparse
+import time
+from io import BytesIO
+
+from api.utils import ImageUploader, InMemoryStrategy
+
+
+def run(images, latency, concurrency):
+    uploader = ImageUploader(InMemoryStrategy(latency=latency), concurrency)
+    image_files = [BytesIO(b'GIF89a' + bytes(1024)) for _ in range(images)]
+    started = time.perf_counter()
+    uploader.upload_images(image_files)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument('--images', type=int, default=100)
+    parser.add_argument('--latency', type=float, default=0.05)
+    parser.add_argument(
+        '--concurrency', type=int, nargs='+', default=[1, 2, 4, 8, 16, 32]
+    )
+    args = parser.parse_args()
+    print(f'{args.images} uploads, {args.latency * 1000:.0f} ms each')
+    print(f'{"concurrency":>12} {"seconds":>9} {"uploads/s":>10} {"speedup":>8}')
+    baseline = None
+    for concurrency in args.concurrency:
+        elapsed = run(args.images, args.latency, concurrency)
+        baseline = baseline or elapsed
+        print(
+            f'{concurrency:>12} {elapsed:>9.3f} {args.images / elapsed:>10.1f}'
+            f' {baseline / elapsed:>7.1f}x'
+        )
+
+
+if __name__ == '__main__':
+    main()